@@ -0,0 +1,328 @@
+"""
+Adjacency View
+
+A per-node projection of the edges around it, so that a filtered network or
+a node's drops can be read from one item instead of an edge query followed
+by node and weight lookups. VIEW_TABLE holds, by node id:
+
+in_weights   {head id: weight} of the edges towards the node
+out_weights  {tail id: weight} of the edges from the node
+nodes        {head id: VIEW_FIELDS of the head} for the edges towards it,
+             without its live location
+drops        {head id: drop} of the network drops on those edges
+local_drops  the node's own drops
+
+Views are built the first time they are read and expire after VIEW_TTL, so
+a write that failed to reach a view is not served for longer. Writers of
+edges and drops update views that exist, and otherwise leave a stub, and
+either way bump the item's 'revision'. A view is only stored if the revision
+is still the one seen before its edges were read, so a write racing the
+build cannot be lost.
+
+A node's changed summary is only patched into the views that exist, found
+by one projected read of 'built_at' per BATCH_GET_LIMIT neighbours. A racing
+build can miss the patch until VIEW_TTL. Where that would take more than
+MAX_VIEW_FANOUT writes, and for the neighbours of a deleted node, views are
+instead replaced by stubs with a fresh revision, a batch at a time, and
+built again on their next read.
+Nodes with more than MAX_VIEW_EDGES edges, or whose view would not fit in
+one item, get a placeholder instead, and are read from the edge table as
+before.
+
+Live locations are left out of views, so that a moving node does not update
+the views around it on every ping. Readers that may show a head's live
+location read it from the node with live_nodes().
+
+"""
+
+import os
+import time
+import boto3
+from api_contract import ADMIN, DISTANT
+from common import make_node_pkey
+from storage_cache import get_node, new_version
+from batch_access import batch_get_items, batch_get_nodes, batch_put_items
+from pagination import iter_items, edges_by_head, edges_by_tail
+from drop_count import has_drop
+from concurrency import gather
+from constants import EDGE_TABLE
+
+VIEW_TABLE = boto3.resource('dynamodb').Table(os.environ.get("IRIS_VIEW_TABLE", "iris-views"))
+
+VIEW_TTL = 24 * 60 * 60
+MAX_VIEW_EDGES = 500
+MAX_VIEW_FANOUT = 25
+VIEW_FIELDS = ('id', 'name', 'description', 'location', 'zoom', 'media')
+
+def _summary(node):
+    summary = {name: node[name] for name in VIEW_FIELDS}
+    summary["location"] = {
+        'default_location': node["location"]["default_location"],
+        'live_location': None
+    }
+    return summary
+
+def _too_large(error):
+    return error.response["Error"]["Code"] == "ValidationException" and "size" in error.response["Error"]["Message"]
+
+def _store(view, revision):
+    """
+    Stores 'view' unless a writer bumped the revision since it was seen, in
+    which case the next read builds it again.
+
+    """
+    if revision is None:
+        condition = "attribute_not_exists(revision)"
+        values = {}
+    else:
+        condition = "revision = :revision"
+        values = {':revision': revision}
+    kwargs = {'Item': view, 'ConditionExpression': condition}
+    if values:
+        kwargs["ExpressionAttributeValues"] = values
+    try:
+        VIEW_TABLE.put_item(**kwargs)
+    except VIEW_TABLE.meta.client.exceptions.ConditionalCheckFailedException:
+        pass
+
+def _placeholder(node_id, revision):
+    return {
+        'id': node_id,
+        'expires_at': int(time.time()) + VIEW_TTL,
+        'revision': revision or 0,
+        'oversized': True
+    }
+
+def _build(node_id, revision=None):
+    node = get_node(node_id)
+    if node is None:
+        return None
+
+    in_edges = list(iter_items(EDGE_TABLE.query, edges_by_tail(node_id)))
+    out_edges = list(iter_items(EDGE_TABLE.query, edges_by_head(node_id)))
+    if len(in_edges) + len(out_edges) > MAX_VIEW_EDGES:
+        view = _placeholder(node_id, revision)
+        _store(view, revision)
+        return view
+
+    heads = batch_get_nodes([edge["head"] for edge in in_edges])
+    in_edges = [edge for edge in in_edges if edge["head"] in heads]
+    view = {
+        'id': node_id,
+        'expires_at': int(time.time()) + VIEW_TTL,
+        'built_at': int(time.time()),
+        'revision': revision or 0,
+        'in_weights': {edge["head"]: edge["weight"] for edge in in_edges},
+        'out_weights': {edge["tail"]: edge["weight"] for edge in out_edges},
+        'nodes': {head_id: _summary(head) for head_id, head in heads.items()},
+        'drops': {edge["head"]: edge["drop"] for edge in in_edges if has_drop(edge)},
+        'local_drops': node["drops"]
+    }
+    try:
+        _store(view, revision)
+    except VIEW_TABLE.meta.client.exceptions.ClientError as error:
+        if not _too_large(error):
+            raise
+        view = _placeholder(node_id, revision)
+        _store(view, revision)
+    return view
+
+def get_views(node_ids):
+    """
+    Views by node id for every node in 'node_ids', built where missing. A
+    node that does not exist, or whose view is a placeholder, maps to None.
+
+    """
+    node_ids = list(dict.fromkeys(node_ids))
+    now = time.time()
+    items = batch_get_items(VIEW_TABLE, [make_node_pkey(node_id) for node_id in node_ids])
+    revisions = {item["id"]: item.get("revision") for item in items}
+    views = {
+        item["id"]: item for item in items
+        if item["expires_at"] > now and ('in_weights' in item or item.get("oversized"))
+    }
+    for node_id in node_ids:
+        if node_id not in views:
+            views[node_id] = _build(node_id, revisions.get(node_id))
+    return {
+        node_id: view if view is not None and not view.get("oversized") else None
+        for node_id, view in views.items()
+    }
+
+def live_nodes(view, head_ids):
+    """
+    The summaries in 'view' of the heads in 'head_ids', by id, with their
+    live locations read from the nodes.
+
+    """
+    nodes = batch_get_nodes(head_ids)
+    return {
+        head_id: dict(view["nodes"][head_id], location=nodes[head_id]["location"])
+        for head_id in head_ids if head_id in nodes
+    }
+
+def weight_to(view, head_id):
+    if head_id == view["id"]:
+        return ADMIN
+    return view["in_weights"].get(head_id, DISTANT)
+
+def weight_from(view, tail_id):
+    if tail_id == view["id"]:
+        return ADMIN
+    return view["out_weights"].get(tail_id, DISTANT)
+
+def _invalidate(node_id, clauses="", values=None):
+    """
+    Bumps the revision of the item of 'node_id', leaving a stub if there is
+    none, so that a view being built from older edges is not stored.
+
+    """
+    expression_values = {
+        ':expires_at': int(time.time()) + VIEW_TTL,
+        ':one': 1
+    }
+    expression_values.update(values or {})
+    VIEW_TABLE.update_item(
+        Key=make_node_pkey(node_id),
+        UpdateExpression="SET expires_at = if_not_exists(expires_at, :expires_at) " + clauses + "ADD revision :one",
+        ExpressionAttributeValues=expression_values
+    )
+
+def _oversize(node_id):
+    _invalidate(node_id, ", oversized = :oversized REMOVE in_weights, out_weights, nodes, drops, local_drops ",
+                {':oversized': True})
+
+def _write(node_id, kwargs, existing_only=False):
+    """
+    Applies the update in 'kwargs' to the view of 'node_id' if it has one, and
+    otherwise invalidates it, unless 'existing_only'.
+
+    """
+    kwargs["Key"] = make_node_pkey(node_id)
+    kwargs["UpdateExpression"] += " ADD revision :one"
+    kwargs["ConditionExpression"] = "attribute_exists(in_weights)"
+    kwargs.setdefault("ExpressionAttributeValues", {})[":one"] = 1
+    try:
+        VIEW_TABLE.update_item(**kwargs)
+    except VIEW_TABLE.meta.client.exceptions.ConditionalCheckFailedException:
+        if not existing_only:
+            _invalidate(node_id)
+    except VIEW_TABLE.meta.client.exceptions.ClientError as error:
+        if not _too_large(error):
+            raise
+        _oversize(node_id)
+
+def _update(node_id, sets=(), removes=(), existing_only=False):
+    """
+    Applies 'sets', (map, key, value) triples, and 'removes', (map, key)
+    pairs, to the view of 'node_id' if it has one.
+
+    """
+    names = {}
+    values = {}
+
+    def path(map_name, key, placeholder):
+        names["#" + map_name] = map_name
+        names[placeholder] = key
+        return "#" + map_name + "." + placeholder
+
+    clauses = []
+    set_clauses = []
+    for index, (map_name, key, value) in enumerate(sets):
+        values[":s%d" % index] = value
+        set_clauses.append(path(map_name, key, "#s%d" % index) + " = :s%d" % index)
+    if set_clauses:
+        clauses.append("SET " + ", ".join(set_clauses))
+    remove_clauses = [path(map_name, key, "#r%d" % index) for index, (map_name, key) in enumerate(removes)]
+    if remove_clauses:
+        clauses.append("REMOVE " + ", ".join(remove_clauses))
+
+    kwargs = {
+        'UpdateExpression': " ".join(clauses),
+        'ExpressionAttributeNames': names
+    }
+    if values:
+        kwargs["ExpressionAttributeValues"] = values
+    _write(node_id, kwargs, existing_only)
+
+def _apply(changes, existing_only=False):
+    gather(*[
+        (lambda node_id=node_id, sets=sets, removes=removes: _update(node_id, sets, removes, existing_only))
+        for node_id, (sets, removes) in changes.items() if sets or removes
+    ])
+
+def _existing_views(node_ids):
+    now = time.time()
+    items = batch_get_items(VIEW_TABLE, [make_node_pkey(node_id) for node_id in dict.fromkeys(node_ids)],
+                            ("id", "built_at", "expires_at"))
+    return [item["id"] for item in items if 'built_at' in item and item["expires_at"] > now]
+
+def invalidate_views(node_ids):
+    """
+    Replaces the views of 'node_ids' by stubs with a fresh revision, so they
+    are built again on their next read and no build in progress is stored.
+
+    """
+    expires_at = int(time.time()) + VIEW_TTL
+    batch_put_items(VIEW_TABLE, [
+        {'id': node_id, 'revision': new_version(), 'expires_at': expires_at}
+        for node_id in dict.fromkeys(node_ids)
+    ])
+
+def update_edges(upserts=(), deletes=()):
+    """
+    Reflects edges set to a weight, (head, tail, weight) in 'upserts', and
+    deleted edges, (head, tail) in 'deletes', in the views of both ends.
+
+    """
+    upserts = list(upserts)
+    heads = batch_get_nodes([head_id for head_id, _, _ in upserts])
+    changes = {}
+    for head_id, tail_id, weight in upserts:
+        tail_sets, _ = changes.setdefault(tail_id, ([], []))
+        tail_sets.append(("in_weights", head_id, weight))
+        if head_id in heads:
+            tail_sets.append(("nodes", head_id, _summary(heads[head_id])))
+        changes.setdefault(head_id, ([], []))[0].append(("out_weights", tail_id, weight))
+    for head_id, tail_id in deletes:
+        changes.setdefault(tail_id, ([], []))[1].extend([("in_weights", head_id), ("nodes", head_id), ("drops", head_id)])
+        changes.setdefault(head_id, ([], []))[1].append(("out_weights", tail_id))
+    _apply(changes)
+
+def update_drop(head_id, tail_id, drop):
+    """
+    Reflects the network drop on the edge from 'head_id' to 'tail_id', or
+    its removal if 'drop' is None.
+
+    """
+    if drop is None:
+        _update(tail_id, removes=[("drops", head_id)])
+    else:
+        _update(tail_id, sets=[("drops", head_id, drop)])
+
+def update_local_drops(node):
+    _write(node["id"], {
+        'UpdateExpression': "SET local_drops = :local_drops",
+        'ExpressionAttributeValues': {
+            ':local_drops': node["drops"]
+        }
+    })
+
+def update_node(node, previous=None):
+    """
+    Reflects the changed attributes of 'node' in the views of the nodes its
+    edges lead to, unless its summary is the same as that of 'previous'.
+
+    """
+    if previous is not None and _summary(previous) == _summary(node):
+        return
+    view = VIEW_TABLE.get_item(Key=make_node_pkey(node["id"])).get("Item")
+    if view is not None and 'out_weights' in view:
+        tail_ids = list(view["out_weights"])
+    else:
+        tail_ids = [edge["tail"] for edge in iter_items(EDGE_TABLE.query, edges_by_head(node["id"]))]
+    tail_ids = _existing_views(tail_ids)
+    if len(tail_ids) > MAX_VIEW_FANOUT:
+        invalidate_views(tail_ids)
+        return
+    _apply({tail_id: ([("nodes", node["id"], _summary(node))], []) for tail_id in tail_ids}, existing_only=True)
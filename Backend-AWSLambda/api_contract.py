@@ -1,3 +1,6 @@
+import threading
+import time
+from collections import OrderedDict
 import s3_access
 
 ADMIN = "Admin"
@@ -10,6 +13,40 @@ JPG = "jpg"
 MP4 = "mp4"
 MOV = "mov"
 
+PRESIGNED_URL_LIFETIME = 3600
+PRESIGNED_URL_BUCKET = 900
+PRESIGNED_URL_MARGIN = 300
+PRESIGNED_URL_CACHE_SIZE = 2048
+
+_presigned_urls = OrderedDict()
+_presigned_urls_lock = threading.Lock()
+
+def _presigned_url(object_key):
+    """
+    Presigned URL for 'object_key', reused across requests in a warm container.
+    Cached URLs are kept until the end of the PRESIGNED_URL_BUCKET they were 
+    signed in, so responses repeat byte-identical URLs, and never closer than
+    PRESIGNED_URL_MARGIN seconds to their expiry.
+
+    """
+    now = time.time()
+    bucket = int(now // PRESIGNED_URL_BUCKET)
+    with _presigned_urls_lock:
+        cached = _presigned_urls.get(object_key)
+        if cached is not None:
+            cached_bucket, signed_at, url = cached
+            if cached_bucket == bucket and now < signed_at + PRESIGNED_URL_LIFETIME - PRESIGNED_URL_MARGIN:
+                _presigned_urls.move_to_end(object_key)
+                return url
+
+    url = s3_access.presigned_url(object_key)
+    with _presigned_urls_lock:
+        _presigned_urls[object_key] = (bucket, now, url)
+        _presigned_urls.move_to_end(object_key)
+        while len(_presigned_urls) > PRESIGNED_URL_CACHE_SIZE:
+            _presigned_urls.popitem(last=False)
+    return url
+
 def make_APILocation(node, to_host_weight=DISTANT):
     longitude = node["location"]["default_location"][0]
     latitude = node["location"]["default_location"][1]
@@ -42,12 +79,25 @@ def make_APIGeoTrigger(trigger_id, zoom, api_location):
         }
     }
 
+def make_APIGeoCluster(point_count, api_location):
+    return {
+        'type': "Feature",
+        'properties': {
+            'cluster': True,
+            'point_count': point_count
+        },
+        'geometry': {
+            'type': "Point",
+            'coordinates': api_location
+        }
+    }
+
 def make_APIGeoNode(node, from_host_weight=DISTANT, to_host_weight=DISTANT):
     live_location_enabled = None
     if from_host_weight == ADMIN and to_host_weight == ADMIN:
         live_location_enabled = node["location"]["live_location"] is not None
-    portrait_id = s3_access.presigned_url(node["media"]["portrait_id"])
-    supplement_id = s3_access.presigned_url(node["media"]["supplement_id"])
+    portrait_id = _presigned_url(node["media"]["portrait_id"])
+    supplement_id = _presigned_url(node["media"]["supplement_id"])
     counter_weight = "Distant" if to_host_weight == DISTANT else "Close"
 
     return {
@@ -83,6 +133,45 @@ def make_APIGeoJSON(api_geos):
         "features": api_geos
     }
 
+class APIGeoFeatures:
+    """
+    A FeatureCollection of geo nodes, triggers, points and clusters kept as
+    rows rather than feature dicts, so api_serializer can write large
+    collections without building them. as_APIGeoJSON() gives the equivalent make_APIGeoJSON.
+    'members' are written as additional top-level members of the collection.
+
+    """
+    def __init__(self):
+        self.nodes = []
+        self.triggers = []
+        self.points = []
+        self.clusters = []
+        self.members = {}
+
+    def add_node(self, node, from_host_weight=DISTANT, to_host_weight=DISTANT):
+        self.nodes.append((node, from_host_weight, to_host_weight))
+
+    def add_trigger(self, trigger_id, zoom, api_location):
+        self.triggers.append((trigger_id, zoom, api_location))
+
+    def add_point(self, api_location):
+        self.points.append(api_location)
+
+    def add_cluster(self, point_count, api_location):
+        self.clusters.append((point_count, api_location))
+
+    def __len__(self):
+        return len(self.nodes) + len(self.triggers) + len(self.points) + len(self.clusters)
+
+    def as_APIGeoJSON(self):
+        api_geos = [make_APIGeoNode(*row) for row in self.nodes]
+        api_geos += [make_APIGeoTrigger(*row) for row in self.triggers]
+        api_geos += [make_APIGeoPoint(api_location) for api_location in self.points]
+        api_geos += [make_APIGeoCluster(*row) for row in self.clusters]
+        api_geo_json = make_APIGeoJSON(api_geos)
+        api_geo_json.update(self.members)
+        return api_geo_json
+
 def make_APICanvasDrop(drop, api_geo_node=None):
     x = drop['canvas_location'][0]
     y = drop['canvas_location'][1]
@@ -90,7 +179,7 @@ def make_APICanvasDrop(drop, api_geo_node=None):
     
     image_id = None
     if 'image_id' in drop: 
-        image_id = s3_access.presigned_url(drop["image_id"])
+        image_id = _presigned_url(drop["image_id"])
 
     return {
         'id': drop["id"],
@@ -100,6 +189,12 @@ def make_APICanvasDrop(drop, api_geo_node=None):
         'api_geo_node': api_geo_node
     }
 
+def make_APILiveLocation(live_location, coalesced=False):
+    return {
+        'live_location': [float(live_location[0]), float(live_location[1])] if live_location is not None else None,
+        'coalesced': coalesced
+    }
+
 def make_APIServerMessage(message):
     return {
         'message': message
@@ -0,0 +1,185 @@
+"""
+API Serializer
+
+Encodes handler responses to UTF-8 JSON. DynamoDB Decimals are written as
+numbers, and APIGeoFeatures collections are written row by row straight
+into the output instead of going through per-feature dicts and json.dumps.
+
+Collections of triggers and points can also be negotiated as PACKED_TYPE,
+a columnar binary layout (little-endian):
+
+magic "IRGP", u8 version, 3 bytes padding
+u32 trigger count T, u32 point count P
+f32[2T] trigger longitude/latitude pairs
+f32[T]  trigger zooms
+f32[2P] point longitude/latitude pairs
+T trigger ids, each a u16 byte length followed by UTF-8
+u32 byte length followed by the collection's members as a UTF-8 JSON object
+
+Encoders can also feed a hashlib digest, from which lambda_function derives
+the response's ETag. Members in VOLATILE_MEMBERS differ between otherwise
+equal responses, so they are left out of the digest, and written last.
+They are kept in for requests that carried a sync token ('synced'), since
+such a client must receive the newer token, delta or not.
+
+"""
+
+import json
+import struct
+import sys
+from array import array
+from decimal import Decimal
+from api_contract import APIGeoFeatures, make_APIGeoNode
+
+try:
+    from _json import encode_basestring_ascii as _string
+except ImportError:
+    from json.encoder import py_encode_basestring_ascii as _string
+
+_float = float.__repr__
+
+JSON_TYPE = "application/json"
+PACKED_TYPE = "application/vnd.iris.geo+packed"
+PACKED_MAGIC = b"IRGP"
+PACKED_VERSION = 2
+
+VOLATILE_MEMBERS = ("sync_token",)
+
+CRS84_FEATURE_COLLECTION = (
+    '{"type":"FeatureCollection",'
+    '"crs":{"type":"name","properties":{"name":"urn:ogc:def:crs:OGC:1.3:CRS84"}},'
+    '"features":['
+)
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, APIGeoFeatures):
+        return value.as_APIGeoJSON()
+    raise TypeError("API Serializer: Cannot encode " + type(value).__name__)
+
+_encoder = json.JSONEncoder(separators=(",", ":"), default=_default)
+
+def _write_features(features, parts):
+    separator = ""
+    for row in features.nodes:
+        parts.append(separator)
+        parts.append(_encoder.encode(make_APIGeoNode(*row)))
+        separator = ","
+
+    for trigger_id, zoom, api_location in features.triggers:
+        parts.append(separator)
+        parts.append('{"type":"Feature","properties":{"trigger_id":')
+        parts.append(_string(trigger_id))
+        parts.append(',"zoom":')
+        parts.append(_float(float(zoom)))
+        parts.append('},"geometry":{"type":"Point","coordinates":[')
+        parts.append(_float(float(api_location[0])))
+        parts.append(",")
+        parts.append(_float(float(api_location[1])))
+        parts.append("]}}")
+        separator = ","
+
+    for api_location in features.points:
+        parts.append(separator)
+        parts.append('{"type":"Feature","properties":null,"geometry":{"type":"Point","coordinates":[')
+        parts.append(_float(float(api_location[0])))
+        parts.append(",")
+        parts.append(_float(float(api_location[1])))
+        parts.append("]}}")
+        separator = ","
+
+    for point_count, api_location in features.clusters:
+        parts.append(separator)
+        parts.append('{"type":"Feature","properties":{"cluster":true,"point_count":')
+        parts.append(str(int(point_count)))
+        parts.append('},"geometry":{"type":"Point","coordinates":[')
+        parts.append(_float(float(api_location[0])))
+        parts.append(",")
+        parts.append(_float(float(api_location[1])))
+        parts.append("]}}")
+        separator = ","
+
+def _stable_members(members, synced):
+    if synced:
+        return members
+    return {name: value for name, value in members.items() if name not in VOLATILE_MEMBERS}
+
+def _write_members(members, parts):
+    for name, value in members.items():
+        parts.append(",")
+        parts.append(_string(name))
+        parts.append(":")
+        parts.append(_encoder.encode(value))
+
+def encode_features(features, digest=None, synced=False):
+    parts = [CRS84_FEATURE_COLLECTION]
+    _write_features(features, parts)
+    parts.append("]")
+    stable_members = _stable_members(features.members, synced)
+    _write_members(stable_members, parts)
+    body = "".join(parts).encode("utf-8")
+    if digest is not None:
+        digest.update(body)
+
+    parts = []
+    _write_members({name: value for name, value in features.members.items() if name not in stable_members}, parts)
+    parts.append("}")
+    return body + "".join(parts).encode("utf-8")
+
+def encode(response, digest=None, synced=False):
+    """
+    UTF-8 JSON bytes for any handler response.
+
+    """
+    if isinstance(response, APIGeoFeatures):
+        return encode_features(response, digest, synced)
+    body = _encoder.encode(response).encode("utf-8")
+    if digest is not None:
+        digest.update(body)
+    return body
+
+def _float32s(values):
+    floats = array('f', values)
+    if sys.byteorder != "little":
+        floats.byteswap()
+    return floats.tobytes()
+
+def encode_packed(features, digest=None, synced=False):
+    parts = [
+        PACKED_MAGIC,
+        struct.pack("<B3xII", PACKED_VERSION, len(features.triggers), len(features.points))
+    ]
+    parts.append(_float32s(
+        float(value) for _, _, api_location in features.triggers for value in api_location[:2]))
+    parts.append(_float32s(float(zoom) for _, zoom, _ in features.triggers))
+    parts.append(_float32s(float(value) for api_location in features.points for value in api_location[:2]))
+    for trigger_id, _, _ in features.triggers:
+        encoded_id = trigger_id.encode("utf-8")
+        parts.append(struct.pack("<H", len(encoded_id)))
+        parts.append(encoded_id)
+    if digest is not None:
+        for part in parts:
+            digest.update(part)
+        digest.update(_encoder.encode(_stable_members(features.members, synced)).encode("utf-8"))
+    members = _encoder.encode(features.members).encode("utf-8")
+    parts.append(struct.pack("<I", len(members)))
+    parts.append(members)
+    return b"".join(parts)
+
+def _accepts(accept, content_type):
+    if accept is None:
+        return False
+    return any(media_range.split(";")[0].strip().lower() == content_type for media_range in accept.split(","))
+
+def negotiate(response, accept, digest=None, synced=False):
+    """
+    Encoded bytes and content type for 'response', given the request's
+    Accept header. Only collections without geo nodes or clusters can be
+    packed.
+
+    """
+    packable = isinstance(response, APIGeoFeatures) and not response.nodes and not response.clusters
+    if packable and _accepts(accept, PACKED_TYPE):
+        return encode_packed(response, digest, synced), PACKED_TYPE
+    return encode(response, digest, synced), JSON_TYPE
@@ -0,0 +1,232 @@
+"""
+Batch Access
+
+Bulk counterparts of common's single-item reads and writes. Keys are sent
+through BatchGetItem in chunks of BATCH_GET_LIMIT and writes through
+BatchWriteItem in chunks of BATCH_WRITE_LIMIT. Keys and writes DynamoDB
+leaves unprocessed are retried with exponential backoff. Updates that must
+succeed or fail together go through TransactWriteItems.
+
+"""
+
+import time
+import storage_cache
+from api_contract import ADMIN, DISTANT
+from common import make_node_pkey, make_edge_pkey
+from constants import NODE_TABLE, EDGE_TABLE
+
+BATCH_GET_LIMIT = 100
+BATCH_WRITE_LIMIT = 25
+MAX_ATTEMPTS = 8
+BACKOFF_SECONDS = 0.05
+MAX_BACKOFF_SECONDS = 1.0
+
+def _backoff(attempt):
+    if attempt >= MAX_ATTEMPTS:
+        raise Exception("Batch Access: Requests remain unprocessed after retrying")
+    time.sleep(min(BACKOFF_SECONDS * (2 ** attempt), MAX_BACKOFF_SECONDS))
+
+def _chunks(keys_by_table, projections):
+    chunk = {}
+    size = 0
+    for table_name, keys in keys_by_table.items():
+        for key in keys:
+            chunk.setdefault(table_name, dict(projections.get(table_name, {}), Keys=[]))["Keys"].append(key)
+            size += 1
+            if size == BATCH_GET_LIMIT:
+                yield chunk
+                chunk = {}
+                size = 0
+    if chunk:
+        yield chunk
+
+def _batch_get(keys_by_table, projections=None):
+    client = NODE_TABLE.meta.client
+    items = {table_name: [] for table_name in keys_by_table}
+    for request in _chunks(keys_by_table, projections or {}):
+        attempt = 0
+        while request:
+            response = client.batch_get_item(RequestItems=request)
+            for table_name, table_items in response["Responses"].items():
+                items[table_name] += table_items
+            request = response.get("UnprocessedKeys")
+            if request:
+                _backoff(attempt)
+                attempt += 1
+    return items
+
+def batch_get_items(table, keys, attributes=None):
+    """
+    The items of 'table' under 'keys' that exist, in no particular order,
+    with only 'attributes' if given.
+
+    """
+    keys = list(keys)
+    if not keys:
+        return []
+    projections = {}
+    if attributes is not None:
+        names = {"#p%d" % index: name for index, name in enumerate(attributes)}
+        projections[table.name] = {'ProjectionExpression': ", ".join(names), 'ExpressionAttributeNames': names}
+    return _batch_get({table.name: keys}, projections)[table.name]
+
+def _read(node_ids=(), pairs=()):
+    node_ids = list(dict.fromkeys(node_ids))
+    pairs = [(head_id, tail_id) for head_id, tail_id in dict.fromkeys(pairs) if head_id != tail_id]
+    unknown_ids = [node_id for node_id in node_ids if storage_cache.cached_node(node_id) is storage_cache.MISSING]
+    unknown_pairs = [pair for pair in pairs if storage_cache.cached_edge(*pair) is storage_cache.MISSING]
+
+    keys_by_table = {}
+    if unknown_ids:
+        keys_by_table[NODE_TABLE.name] = [make_node_pkey(node_id) for node_id in unknown_ids]
+    if unknown_pairs:
+        keys_by_table[EDGE_TABLE.name] = [make_edge_pkey(head_id, tail_id) for head_id, tail_id in unknown_pairs]
+    items = _batch_get(keys_by_table)
+
+    fetched_nodes = {node["id"]: node for node in items.get(NODE_TABLE.name, [])}
+    for node_id in unknown_ids:
+        storage_cache.remember_node(node_id, fetched_nodes.get(node_id))
+    fetched_edges = {(edge["head"], edge["tail"]): edge for edge in items.get(EDGE_TABLE.name, [])}
+    for head_id, tail_id in unknown_pairs:
+        storage_cache.remember_edge(head_id, tail_id, fetched_edges.get((head_id, tail_id)))
+
+    nodes = {node_id: storage_cache.cached_node(node_id) for node_id in node_ids}
+    edges = {pair: storage_cache.cached_edge(*pair) for pair in pairs}
+    return (
+        {node_id: node for node_id, node in nodes.items() if node is not None},
+        {pair: edge for pair, edge in edges.items() if edge is not None}
+    )
+
+def _resolve_weights(pairs, edges):
+    weights = {}
+    for head_id, tail_id in pairs:
+        if head_id == tail_id:
+            weights[(head_id, tail_id)] = ADMIN
+        elif (head_id, tail_id) in edges:
+            weights[(head_id, tail_id)] = edges[(head_id, tail_id)]["weight"]
+        else:
+            weights[(head_id, tail_id)] = DISTANT
+    return weights
+
+def batch_get_nodes(node_ids):
+    """
+    Nodes by id for every id in 'node_ids' that exists.
+
+    """
+    nodes, _ = _read(node_ids=node_ids)
+    return nodes
+
+def batch_get_edges(pairs):
+    """
+    Edges by (head, tail) for every pair in 'pairs' that exists.
+
+    """
+    _, edges = _read(pairs=pairs)
+    return edges
+
+def batch_get_weights(pairs):
+    """
+    Weights by (head, tail), resolved as common.get_weight resolves them: a
+    node is Admin to itself and Distant to any node it has no edge to.
+
+    """
+    pairs = list(pairs)
+    _, edges = _read(pairs=pairs)
+    return _resolve_weights(pairs, edges)
+
+def batch_get_weights_to(head_ids, tail_id):
+    """
+    Weights by head of every edge from 'head_ids' to 'tail_id'.
+
+    """
+    weights = batch_get_weights([(head_id, tail_id) for head_id in head_ids])
+    return {head_id: weights[(head_id, tail_id)] for head_id in head_ids}
+
+def batch_get_nodes_and_weights(node_ids, pairs):
+    """
+    Nodes by id and weights by (head, tail), read from both tables in the same
+    BatchGetItem requests.
+
+    """
+    pairs = list(pairs)
+    nodes, edges = _read(node_ids, pairs)
+    return nodes, _resolve_weights(pairs, edges)
+
+def _batch_write(table, requests):
+    client = table.meta.client
+    for start in range(0, len(requests), BATCH_WRITE_LIMIT):
+        request = {table.name: requests[start:start + BATCH_WRITE_LIMIT]}
+        attempt = 0
+        while request:
+            response = client.batch_write_item(RequestItems=request)
+            request = response.get("UnprocessedItems")
+            if request:
+                _backoff(attempt)
+                attempt += 1
+
+def batch_put_items(table, items):
+    """
+    Puts every item in 'items' into 'table'.
+
+    """
+    _batch_write(table, [{'PutRequest': {'Item': item}} for item in items])
+
+def batch_delete_edges(pairs):
+    """
+    Deletes the edge of every (head, tail) in 'pairs'.
+
+    """
+    pairs = list(dict.fromkeys(pairs))
+    _batch_write(EDGE_TABLE, [
+        {'DeleteRequest': {'Key': make_edge_pkey(head_id, tail_id)}} for head_id, tail_id in pairs
+    ])
+    for head_id, tail_id in pairs:
+        storage_cache.remember_edge(head_id, tail_id, None)
+
+def batch_write_edges(upserts=(), deletes=()):
+    """
+    Sets the weight of the edge for every (head, tail, weight) in 'upserts'
+    and deletes the edge of every (head, tail) in 'deletes'. Upserted edges
+    keep their other attributes, such as a drop, so repeating a write has no
+    further effect.
+
+    """
+    upserts = list(upserts)
+    existing_edges = batch_get_edges([(head_id, tail_id) for head_id, tail_id, _ in upserts])
+
+    requests = {}
+    for head_id, tail_id in deletes:
+        requests[(head_id, tail_id)] = {'DeleteRequest': {'Key': make_edge_pkey(head_id, tail_id)}}
+    for head_id, tail_id, weight in upserts:
+        edge = dict(existing_edges.get((head_id, tail_id), make_edge_pkey(head_id, tail_id)))
+        edge["weight"] = weight
+        requests[(head_id, tail_id)] = {'PutRequest': {'Item': edge}}
+    _batch_write(EDGE_TABLE, list(requests.values()))
+
+    for (head_id, tail_id), request in requests.items():
+        edge = request["PutRequest"]["Item"] if 'PutRequest' in request else None
+        storage_cache.remember_edge(head_id, tail_id, edge)
+
+def transact_update_items(updates):
+    """
+    Applies every (table, update_item keyword arguments) in 'updates' in one
+    transaction. Returns False, applying none of them, if any condition
+    fails. Transactions conflicting with concurrent writes are retried.
+
+    """
+    items = [{'Update': dict(kwargs, TableName=table.name)} for table, kwargs in updates]
+
+    client = NODE_TABLE.meta.client
+    attempt = 0
+    while True:
+        try:
+            client.transact_write_items(TransactItems=items)
+            return True
+        except client.exceptions.TransactionCanceledException as err:
+            codes = [reason.get("Code") for reason in err.response.get("CancellationReasons", [])]
+            if "ConditionalCheckFailed" in codes:
+                return False
+            if "TransactionConflict" not in codes:
+                raise
+        _backoff(attempt)
+        attempt += 1
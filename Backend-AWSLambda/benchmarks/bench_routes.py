@@ -0,0 +1,214 @@
+"""
+Route Benchmark
+
+Drives every route of lambda_function through the in-memory stand-ins of
+harness.py, on synthetic graphs of growing size, and reports per route the
+latency percentiles and the DynamoDB and S3 calls per request.
+
+Storage calls are deterministic for a given seed, so a run can be checked
+against a baseline written by an earlier one: any route making more calls,
+or slower at p95 by more than the tolerance, fails the run. The handler
+modules themselves are not stubbed: routes whose module is missing from
+the tree are reported as skipped.
+
+Usage: python benchmarks/bench_routes.py [--sizes 100,1000] [--requests 20]
+       [--degree 8] [--distribution uniform|powerlaw] [--drops 2]
+       [--write-baseline FILE] [--baseline FILE] [--tolerance 0.5]
+
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import harness
+# The stand-ins must be in place before graph imports the handler modules.
+harness.start()
+import graph
+
+# Added to every latency allowance, so sub-millisecond routes are not
+# failed on timer noise.
+LATENCY_SLACK_MS = 1.0
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def _host_body(host_id, rng):
+    location = [str(round(rng.uniform(-77, -76), 6)), str(round(rng.uniform(42, 43), 6))]
+    return {
+        'id': host_id,
+        'name': "Host " + host_id,
+        'description': "Benchmark host",
+        'default_location': location,
+        'portrait_id': "portrait-" + host_id,
+        'supplement_id': "supplement-" + host_id
+    }
+
+def _scenarios(node_ids, rng, run):
+    """
+    (route name, event) pairs covering every route, one round per call.
+    Hosts and drops created in a round are deleted in the same round.
+
+    """
+    host_id, entity_id = rng.sample(node_ids, 2)
+    user_id = graph.user_id(host_id)
+    new_host_id = "bench-host-%d" % run
+    new_user_id = graph.user_id(new_host_id)
+    drop_id = "bench-drop-%d" % run
+    host_path = {'host_id': host_id}
+    event = harness.make_event
+
+    return [
+        ("GET organizations", event("/public/organizations", "GET")),
+        ("GET hosts", event("/private/hosts", "GET", user_id)),
+        ("POST hosts", event("/private/hosts", "POST", new_user_id, body=_host_body(new_host_id, rng))),
+        ("PATCH host", event("/private/hosts/{host_id}", "PATCH", user_id, host_path,
+                             body={'description': "Updated %d" % run})),
+        ("PUT live location", event("/private/hosts/{host_id}/live_location", "PUT", user_id, host_path,
+                                    body={'live_location': [str(round(rng.uniform(-77, -76), 6)),
+                                                            str(round(rng.uniform(42, 43), 6))]})),
+        ("GET network", event("/private/hosts/{host_id}/network", "GET", user_id, host_path)),
+        ("GET network bbox", event("/private/hosts/{host_id}/network", "GET", user_id, host_path,
+                                   query={'bbox': "-76.6,42.35,-76.4,42.55", 'zoom': "12"})),
+        ("GET network filter", event("/private/hosts/{host_id}/network", "GET", user_id, host_path,
+                                     query={'filter': entity_id})),
+        ("PATCH network", event("/private/hosts/{host_id}/network", "PATCH", user_id, host_path,
+                                query={'filter': entity_id}, body={'weight': "Peer"})),
+        ("POST trigger", event("/private/hosts/{host_id}/network/triggers", "POST", user_id, host_path,
+                               body={'id': entity_id})),
+        ("GET drops", event("/private/hosts/{host_id}/drops", "GET", user_id, host_path,
+                            query={'filter': host_id})),
+        ("POST drop", event("/private/hosts/{host_id}/drops", "POST", new_user_id, {'host_id': new_host_id},
+                            body={'id': drop_id, 'canvas_location': ["0", "0", "0"], 'image_id': "image-" + drop_id})),
+        ("DELETE drop", event("/private/hosts/{host_id}/drops/{drop_id}", "DELETE", new_user_id,
+                              {'host_id': new_host_id, 'drop_id': drop_id})),
+        ("POST report", event("/private/hosts/{host_id}/reports/{entity_id}", "POST", user_id,
+                              {'host_id': host_id, 'entity_id': entity_id})),
+        ("DELETE host", event("/private/hosts/{host_id}", "DELETE", new_user_id, {'host_id': new_host_id}))
+    ]
+
+def _available(event):
+    import lambda_function
+    route = lambda_function.ROUTES[(event["resource"], event["httpMethod"])]
+    return importlib.util.find_spec(route[0]) is not None
+
+def run(size, requests, degree, distribution, drops, seed=7):
+    """
+    Results by route name for a graph of 'size' nodes: None if the route's
+    handler is not in this tree, otherwise its percentiles and mean calls.
+
+    """
+    harness.reset()
+    import constants
+    node_ids = graph.generate(constants.NODE_TABLE, constants.EDGE_TABLE, size,
+                              degree=degree, distribution=distribution, drops=drops, seed=seed)
+    rng = random.Random(seed)
+
+    samples = {}
+    for index in range(requests):
+        for name, event in _scenarios(node_ids, rng, index):
+            if name in samples and samples[name] is None:
+                continue
+            if not _available(event):
+                samples[name] = None
+                continue
+            response, seconds, dynamodb_calls, s3_calls = harness.serve(event)
+            samples.setdefault(name, []).append((seconds, dynamodb_calls, s3_calls, response["statusCode"]))
+
+    results = {}
+    for name, route_samples in samples.items():
+        if route_samples is None:
+            results[name] = None
+            continue
+        milliseconds = [seconds * 1000 for seconds, _, _, _ in route_samples]
+        results[name] = {
+            'p50_ms': _percentile(milliseconds, 0.50),
+            'p95_ms': _percentile(milliseconds, 0.95),
+            'p99_ms': _percentile(milliseconds, 0.99),
+            'dynamodb_calls': sum(calls for _, calls, _, _ in route_samples) / len(route_samples),
+            's3_calls': sum(calls for _, _, calls, _ in route_samples) / len(route_samples),
+            'errors': sum(1 for _, _, _, status in route_samples if status != 200)
+        }
+    return results
+
+def _report(size, results):
+    print("\n%d nodes" % size)
+    print("%-20s %9s %9s %9s %10s %8s %7s" % ("route", "p50 ms", "p95 ms", "p99 ms", "dynamodb", "s3", "errors"))
+    for name, result in results.items():
+        if result is None:
+            print("%-20s %s" % (name, "skipped, handler not in this tree"))
+            continue
+        print("%-20s %9.2f %9.2f %9.2f %10.1f %8.1f %7d" % (
+            name, result["p50_ms"], result["p95_ms"], result["p99_ms"],
+            result["dynamodb_calls"], result["s3_calls"], result["errors"]))
+
+def _report_scaling(results_by_size):
+    sizes = sorted(results_by_size)
+    smallest, largest = results_by_size[sizes[0]], results_by_size[sizes[-1]]
+    print("\nscaling from %d to %d nodes (%.0fx)" % (sizes[0], sizes[-1], sizes[-1] / sizes[0]))
+    print("%-20s %12s %12s" % ("route", "p50 x", "dynamodb x"))
+    for name, result in largest.items():
+        if result is None or smallest.get(name) is None:
+            continue
+        base = smallest[name]
+        print("%-20s %12.2f %12.2f" % (
+            name, result["p50_ms"] / max(base["p50_ms"], 1e-9),
+            result["dynamodb_calls"] / max(base["dynamodb_calls"], 1e-9)))
+
+def _regressions(results_by_size, baseline, tolerance):
+    regressions = []
+    for size, results in results_by_size.items():
+        for name, result in results.items():
+            expected = baseline.get(str(size), {}).get(name)
+            if result is None or expected is None:
+                continue
+            if result["errors"] > expected["errors"]:
+                regressions.append("%d nodes, %s: %d errors" % (size, name, result["errors"]))
+            if result["dynamodb_calls"] > expected["dynamodb_calls"] or result["s3_calls"] > expected["s3_calls"]:
+                regressions.append("%d nodes, %s: %.1f dynamodb and %.1f s3 calls, baseline %.1f and %.1f" % (
+                    size, name, result["dynamodb_calls"], result["s3_calls"],
+                    expected["dynamodb_calls"], expected["s3_calls"]))
+            if result["p95_ms"] > expected["p95_ms"] * (1 + tolerance) + LATENCY_SLACK_MS:
+                regressions.append("%d nodes, %s: p95 %.2f ms, baseline %.2f ms" % (
+                    size, name, result["p95_ms"], expected["p95_ms"]))
+    return regressions
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark every route against in-memory storage.")
+    parser.add_argument("--sizes", default="100,1000")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--degree", type=int, default=8)
+    parser.add_argument("--distribution", choices=graph.DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--drops", type=int, default=2)
+    parser.add_argument("--baseline")
+    parser.add_argument("--write-baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    results_by_size = {}
+    for size in [int(size) for size in args.sizes.split(",")]:
+        results_by_size[size] = run(size, args.requests, args.degree, args.distribution, args.drops)
+        _report(size, results_by_size[size])
+    if len(results_by_size) > 1:
+        _report_scaling(results_by_size)
+
+    if args.write_baseline:
+        with open(args.write_baseline, "w") as baseline_file:
+            json.dump({str(size): results for size, results in results_by_size.items()}, baseline_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = _regressions(results_by_size, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,93 @@
+"""
+Serialization Benchmark
+
+Compares encoding read_network sized trigger collections through feature
+dicts and json.dumps against APIGeoFeatures and api_serializer.
+
+Usage: python benchmarks/bench_serialization.py [node counts...]
+
+"""
+
+import json
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import harness
+
+# api_contract imports s3_access, which needs AWS; nothing here is signed.
+sys.modules["s3_access"] = harness.FakeS3Access()
+
+from api_contract import APIGeoFeatures, make_APIGeoJSON, make_APIGeoTrigger, make_APIGeoPoint, make_APILocation, PEER, DISTANT
+import api_serializer
+
+def make_nodes(count, seed=7):
+    rng = random.Random(seed)
+    nodes = []
+    for index in range(count):
+        live_location = None
+        if rng.random() < 0.3:
+            live_location = [str(round(rng.uniform(-180, 180), 6)), str(round(rng.uniform(-90, 90), 6))]
+        nodes.append({
+            'id': "node-%08d" % index,
+            'zoom': Decimal(rng.choice([3, 12, 16])),
+            'location': {
+                'default_location': [str(round(rng.uniform(-180, 180), 6)), str(round(rng.uniform(-90, 90), 6))],
+                'live_location': live_location
+            }
+        })
+    return nodes
+
+def current_path(nodes, weights):
+    geo_triggers = []
+    geo_points = []
+    for node in nodes:
+        location = make_APILocation(node, weights[node["id"]])
+        if weights[node["id"]] == DISTANT:
+            geo_points.append(make_APIGeoPoint(location))
+        else:
+            geo_triggers.append(make_APIGeoTrigger(node["id"], node["zoom"], location))
+    return json.dumps(make_APIGeoJSON(geo_triggers + geo_points)).encode("utf-8")
+
+def fast_path(nodes, weights):
+    features = APIGeoFeatures()
+    for node in nodes:
+        location = make_APILocation(node, weights[node["id"]])
+        if weights[node["id"]] == DISTANT:
+            features.add_point(location)
+        else:
+            features.add_trigger(node["id"], node["zoom"], location)
+    return api_serializer.encode(features)
+
+def measure(path, nodes, weights, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = path(nodes, weights)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, payload
+
+def main(counts):
+    print("%10s %12s %12s %12s %12s %8s" % ("nodes", "current ms", "current MB/s", "fast ms", "fast MB/s", "speedup"))
+    for count in counts:
+        nodes = make_nodes(count)
+        rng = random.Random(count)
+        weights = {node["id"]: rng.choice([PEER, DISTANT, DISTANT]) for node in nodes}
+        repeat = max(3, 100000 // count)
+        current_seconds, current_payload = measure(current_path, nodes, weights, repeat)
+        fast_seconds, fast_payload = measure(fast_path, nodes, weights, repeat)
+        if json.loads(current_payload) != json.loads(fast_payload):
+            raise Exception("Serialization Benchmark: Paths disagree at %d nodes" % count)
+        print("%10d %12.2f %12.1f %12.2f %12.1f %7.2fx" % (
+            count,
+            current_seconds * 1000, len(current_payload) / current_seconds / 1e6,
+            fast_seconds * 1000, len(fast_payload) / fast_seconds / 1e6,
+            current_seconds / fast_seconds))
+
+if __name__ == "__main__":
+    main([int(count) for count in sys.argv[1:]] or [1000, 10000, 100000])
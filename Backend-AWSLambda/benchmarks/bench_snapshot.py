@@ -0,0 +1,121 @@
+"""
+Snapshot Benchmark
+
+Compares placing the whole network from a node snapshot, see node_snapshot,
+with the per-node path of read_network, on synthetic graphs held in memory.
+Both are given the same nodes and serve weights from memory, so only the
+selection and placement are timed, for the whole map and for a viewport.
+The per-node path is given every node, as the scan of an unindexed read
+would; with a bbox the handler first narrows them down with the geo index.
+Building the snapshot is timed too, as a cold container pays it once. The
+generated graph is frozen out of the garbage collector's reach, so that
+collections triggered by a path are not charged for the fixture's objects.
+
+Usage: python benchmarks/bench_snapshot.py [--sizes 10000,100000]
+       [--repeat 5] [--bbox -76.6,42.35,-76.4,42.55]
+
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import harness
+harness.start()
+import graph
+
+class _MemoryTable:
+    """
+    Keeps what graph.generate writes to a table.
+
+    """
+    def __init__(self):
+        self.items = []
+
+    def batch_writer(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def put_item(self, Item):
+        self.items.append(Item)
+
+def _digest(triggers):
+    return hash(tuple(sorted((node_id, float(zoom), tuple(location)) for node_id, zoom, location in triggers)))
+
+def _timed(call, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        result = None
+        start = time.perf_counter()
+        result = call()
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)[len(timings) // 2], result
+
+def run(size, repeat, bbox):
+    import node_snapshot
+    import read_network
+    from api_contract import APIGeoFeatures, DISTANT
+    if node_snapshot.numpy is None:
+        raise Exception("Snapshot Benchmark: numpy is not installed")
+
+    node_table, edge_table = _MemoryTable(), _MemoryTable()
+    graph.generate(node_table, edge_table, size)
+    nodes = node_table.items
+    host_id = nodes[0]["id"]
+    weights = {edge["head"]: edge["weight"] for edge in edge_table.items if edge["tail"] == host_id}
+
+    def weights_to_host(node_ids, tail_id=host_id):
+        return {node_id: weights.get(node_id, DISTANT) for node_id in node_ids}
+    read_network.batch_get_weights_to = weights_to_host
+    gc.collect()
+    gc.freeze()
+
+    def per_node(viewport):
+        features = APIGeoFeatures()
+        read_network._add_features(features, host_id, ((node, True) for node in nodes), viewport)
+        return features.triggers
+
+    build_ms, snapshot = _timed(lambda: node_snapshot.NodeSnapshot(nodes, None), repeat)
+    results = {'build': (None, build_ms)}
+    for name, viewport in (("map", None), ("viewport", bbox)):
+        per_node_ms, expected = _timed(lambda: per_node(viewport), repeat)
+        count, expected = len(expected), _digest(expected)
+        snapshot_ms, triggers = _timed(lambda: snapshot.triggers(viewport, weights_to_host), repeat)
+        if _digest(triggers) != expected:
+            raise Exception("Snapshot Benchmark: Snapshot and per-node triggers differ")
+        triggers = None
+        results[name] = (per_node_ms, snapshot_ms, count)
+    gc.unfreeze()
+    return results
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Compare node snapshot placement with the per-node path.")
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--bbox", default="-76.6,42.35,-76.4,42.55")
+    args = parser.parse_args(argv)
+
+    from geo_index import parse_bbox
+    bbox = parse_bbox(args.bbox)
+    print("%-10s %-10s %10s %12s %12s %9s" % ("nodes", "read", "triggers", "per-node ms", "snapshot ms", "speedup"))
+    for size in [int(size) for size in args.sizes.split(",")]:
+        results = run(size, args.repeat, bbox)
+        for name in ("map", "viewport"):
+            per_node_ms, snapshot_ms, count = results[name]
+            print("%-10d %-10s %10d %12.2f %12.2f %8.1fx" % (
+                size, name, count, per_node_ms, snapshot_ms, per_node_ms / max(snapshot_ms, 1e-9)))
+        print("%-10d %-10s %10s %12s %12.2f" % (size, "build", "", "", results["build"][1]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
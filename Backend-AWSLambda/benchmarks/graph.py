@@ -0,0 +1,113 @@
+"""
+Synthetic Graph
+
+Writes a synthetic network straight into the node and edge tables, in the
+shape the handlers write it. Every node is a host created by its own user,
+"user-<id>". Out-degrees follow the chosen distribution:
+
+uniform    every node has 'degree' edges
+powerlaw   Pareto distributed around a mean of 'degree', a few hubs and
+           many sparsely connected nodes
+
+Edges are Peer or Aquainted. Every host gets 'drops' drops, local ones and,
+where it has Peer edges towards it, network ones on those edges.
+
+"""
+
+import random
+from api_contract import PEER, AQUAINTED
+from geo_index import index_attributes
+
+DISTRIBUTIONS = ("uniform", "powerlaw")
+
+def node_id(index):
+    return "node-%07d" % index
+
+def user_id(host_id):
+    return "user-" + host_id
+
+def _location(rng, center, spread):
+    return [
+        str(round(max(-180.0, min(180.0, rng.gauss(center[0], spread))), 6)),
+        str(round(max(-90.0, min(90.0, rng.gauss(center[1], spread))), 6))
+    ]
+
+def _degrees(rng, count, degree, distribution):
+    if distribution == "uniform":
+        return [degree] * count
+    alpha = 2.0
+    return [min(count - 1, int(degree * (alpha - 1) / alpha * rng.paretovariate(alpha))) for _ in range(count)]
+
+def _drop(rng, drop_id, image=True):
+    drop = {
+        'id': drop_id,
+        'canvas_location': [str(round(rng.uniform(-1, 1), 3)) for _ in range(3)]
+    }
+    if image:
+        drop["image_id"] = "image-" + drop_id
+    return drop
+
+def generate(node_table, edge_table, node_count, degree=8, distribution="uniform", drops=2,
+             center=(-76.5, 42.45), spread=0.5, seed=7):
+    """
+    Writes 'node_count' nodes and their edges and returns the node ids.
+
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise Exception("Synthetic Graph: Unknown distribution " + distribution)
+    rng = random.Random(seed)
+    node_ids = [node_id(index) for index in range(node_count)]
+
+    edges = {}
+    for head_id, out_degree in zip(node_ids, _degrees(rng, node_count, degree, distribution)):
+        for tail_id in rng.sample(node_ids, min(out_degree + 1, node_count)):
+            if tail_id != head_id:
+                edges[(head_id, tail_id)] = {
+                    'head': head_id,
+                    'tail': tail_id,
+                    'weight': PEER if rng.random() < 0.5 else AQUAINTED
+                }
+
+    peers_by_tail = {}
+    for (head_id, tail_id), edge in edges.items():
+        if edge["weight"] == PEER:
+            peers_by_tail.setdefault(tail_id, []).append(edge)
+
+    with node_table.batch_writer() as writer:
+        for host_id in node_ids:
+            peer_edges = peers_by_tail.get(host_id, [])
+            network_drops = min(len(peer_edges), drops // 2)
+            for edge in rng.sample(peer_edges, network_drops):
+                edge["drop"] = _drop(rng, edge["head"], image=False)
+            local_drops = [_drop(rng, "%s-drop-%d" % (host_id, index)) for index in range(drops - network_drops)]
+
+            live_location = _location(rng, center, spread) if rng.random() < 0.3 else None
+            location = {
+                'default_location': _location(rng, center, spread),
+                'live_location': live_location
+            }
+            item = {
+                'id': host_id,
+                'name': "Host " + host_id,
+                'description': "Synthetic host",
+                'location': location,
+                'zoom': rng.choice(["3", "12", "16"]),
+                'drops': local_drops,
+                'drop_count': drops,
+                'creator': user_id(host_id),
+                'media': {
+                    'portrait_id': "portrait-" + host_id,
+                    'supplement_id': "supplement-" + host_id
+                },
+                'version': 1
+            }
+            for name, value in index_attributes(location).items():
+                if value is not None:
+                    item[name] = value
+            writer.put_item(Item=item)
+
+    with edge_table.batch_writer() as writer:
+        for edge in edges.values():
+            writer.put_item(Item=edge)
+
+    return node_ids
@@ -0,0 +1,261 @@
+"""
+Benchmark Harness
+
+Runs the handlers against in-memory stand-ins for AWS. DynamoDB is served
+by moto's in-memory backend, with the node, edge, change and view tables
+and their indexes created fresh. constants.NODE_TABLE and EDGE_TABLE point at
+them, and s3_access is replaced by FakeS3Access, which keeps no objects and
+only counts its calls. common, which this tree does not ship, is stood in for
+by FakeCommon where it cannot be imported.
+
+start() must run before any handler module is imported, since the handlers
+bind the tables and s3_access when they are imported. Requires moto, and
+moto[server] for start_server(), which lets several processes share one
+in-memory DynamoDB.
+
+"""
+
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+NODE_TABLE_NAME = "bench-nodes"
+EDGE_TABLE_NAME = "bench-edges"
+CHANGE_TABLE_NAME = "bench-changes"
+VIEW_TABLE_NAME = "bench-views"
+OFFICER_IDS = ["bench-officer"]
+
+def _string_attributes(names):
+    return [{'AttributeName': name, 'AttributeType': "S"} for name in names]
+
+def _index(name, hash_key, range_key=None):
+    key_schema = [{'AttributeName': hash_key, 'KeyType': "HASH"}]
+    if range_key is not None:
+        key_schema.append({'AttributeName': range_key, 'KeyType': "RANGE"})
+    return {'IndexName': name, 'KeySchema': key_schema, 'Projection': {'ProjectionType': "ALL"}}
+
+def _create_tables(dynamodb):
+    dynamodb.create_table(
+        TableName=NODE_TABLE_NAME,
+        BillingMode="PAY_PER_REQUEST",
+        KeySchema=[{'AttributeName': "id", 'KeyType': "HASH"}],
+        AttributeDefinitions=_string_attributes(
+            ["id", "creator", "geohash_cell", "geohash", "live_geohash_cell", "live_geohash"]),
+        GlobalSecondaryIndexes=[
+            _index("creator-index", "creator"),
+            _index("geohash-index", "geohash_cell", "geohash"),
+            _index("live-geohash-index", "live_geohash_cell", "live_geohash")
+        ]
+    )
+    dynamodb.create_table(
+        TableName=EDGE_TABLE_NAME,
+        BillingMode="PAY_PER_REQUEST",
+        KeySchema=[{'AttributeName': "head", 'KeyType': "HASH"}, {'AttributeName': "tail", 'KeyType': "RANGE"}],
+        AttributeDefinitions=_string_attributes(["head", "tail"]),
+        GlobalSecondaryIndexes=[_index("tail-index", "tail", "head")]
+    )
+    dynamodb.create_table(
+        TableName=CHANGE_TABLE_NAME,
+        BillingMode="PAY_PER_REQUEST",
+        KeySchema=[{'AttributeName': "stream", 'KeyType': "HASH"}, {'AttributeName': "stamp", 'KeyType': "RANGE"}],
+        AttributeDefinitions=_string_attributes(["stream", "stamp"])
+    )
+    dynamodb.create_table(
+        TableName=VIEW_TABLE_NAME,
+        BillingMode="PAY_PER_REQUEST",
+        KeySchema=[{'AttributeName': "id", 'KeyType': "HASH"}],
+        AttributeDefinitions=_string_attributes(["id"])
+    )
+
+def reset():
+    """
+    Empties the stand-ins by recreating the tables.
+
+    """
+    import boto3
+    start()
+    dynamodb = boto3.client('dynamodb')
+    for table_name in (NODE_TABLE_NAME, EDGE_TABLE_NAME, CHANGE_TABLE_NAME, VIEW_TABLE_NAME):
+        dynamodb.delete_table(TableName=table_name)
+    _create_tables(dynamodb)
+
+class FakeS3Access(types.ModuleType):
+    """
+    Stands in for s3_access. Presigned URLs are made up locally, as the real
+    ones are signed locally too, and deletes only count.
+
+    """
+    def __init__(self):
+        super().__init__("s3_access")
+        self.calls = 0
+
+    def presigned_url(self, object_key):
+        return "https://bench-media.invalid/" + object_key + "?expires=" + str(int(time.time()) + 3600)
+
+    def delete_object(self, object_key):
+        self.calls += 1
+
+class FakeCommon(types.ModuleType):
+    """
+    Stands in for common: keys, lookups and field checks over the tables in
+    constants, as the handlers use them.
+
+    """
+    def __init__(self):
+        super().__init__("common")
+
+    def valid_string(self, value):
+        return isinstance(value, str) and len(value) > 0
+
+    def valid_location(self, location):
+        try:
+            return len(location) == 2 and -180 <= float(location[0]) <= 180 and -90 <= float(location[1]) <= 90
+        except (TypeError, ValueError):
+            return False
+
+    def valid_canvas_location(self, location):
+        try:
+            return len(location) == 3 and all(float(value) == float(value) for value in location)
+        except (TypeError, ValueError):
+            return False
+
+    def make_node_pkey(self, node_id):
+        return {'id': node_id}
+
+    def make_edge_pkey(self, head_id, tail_id):
+        return {'head': head_id, 'tail': tail_id}
+
+    def get_node(self, node_id):
+        import constants
+        return constants.NODE_TABLE.get_item(Key=self.make_node_pkey(node_id)).get("Item")
+
+    def get_edge(self, head_id, tail_id):
+        import constants
+        return constants.EDGE_TABLE.get_item(Key=self.make_edge_pkey(head_id, tail_id)).get("Item")
+
+    def get_weight(self, head_id, tail_id):
+        from api_contract import ADMIN, DISTANT
+        if head_id == tail_id:
+            return ADMIN
+        edge = self.get_edge(head_id, tail_id)
+        return edge["weight"] if edge is not None else DISTANT
+
+class _CallCounter:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, model, **kwargs):
+        if model.service_model.service_name == "dynamodb":
+            self.calls += 1
+
+_started = None
+
+def _set_environment():
+    for name, value in [("AWS_DEFAULT_REGION", "us-east-1"), ("AWS_ACCESS_KEY_ID", "bench"),
+                        ("AWS_SECRET_ACCESS_KEY", "bench")]:
+        os.environ.setdefault(name, value)
+    os.environ["IRIS_CHANGE_TABLE"] = CHANGE_TABLE_NAME
+    os.environ["IRIS_VIEW_TABLE"] = VIEW_TABLE_NAME
+
+def start_server():
+    """
+    Starts moto as a local server and returns its endpoint URL, to be passed
+    to start() in every process that should share it.
+
+    """
+    from moto.server import ThreadedMotoServer
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    return "http://%s:%d" % (host, port)
+
+def start(endpoint_url=None, create_tables=True):
+    """
+    Starts the stand-ins and returns (dynamodb call counter, FakeS3Access).
+    DynamoDB is in this process, or the moto server at 'endpoint_url'.
+
+    """
+    global _started
+    if _started is not None:
+        return _started
+
+    _set_environment()
+    if endpoint_url is None:
+        from moto import mock_aws
+        mock_aws().start()
+    else:
+        os.environ["AWS_ENDPOINT_URL"] = endpoint_url
+
+    import boto3
+    import instrumentation
+    instrumentation.install()
+    counter = _CallCounter()
+    boto3.DEFAULT_SESSION.events.register('before-call', counter, unique_id='iris-benchmark')
+
+    if create_tables:
+        _create_tables(boto3.client('dynamodb'))
+
+    s3_access = FakeS3Access()
+    sys.modules["s3_access"] = s3_access
+
+    try:
+        import constants
+    except ImportError:
+        constants = types.ModuleType("constants")
+        constants.OFFICER_IDS = OFFICER_IDS
+        sys.modules["constants"] = constants
+    dynamodb = boto3.resource('dynamodb')
+    constants.NODE_TABLE = dynamodb.Table(NODE_TABLE_NAME)
+    constants.EDGE_TABLE = dynamodb.Table(EDGE_TABLE_NAME)
+
+    try:
+        import common
+    except ImportError:
+        sys.modules["common"] = FakeCommon()
+
+    # lambda_function turns on DEBUG logging, which would dominate timings.
+    import lambda_function
+    for name in ("boto3", "botocore", "urllib3", "moto", "lambda_function"):
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+
+    _started = (counter, s3_access)
+    return _started
+
+def make_event(resource, method, user_id=None, path=None, query=None, body=None, headers=None):
+    return {
+        'resource': resource,
+        'httpMethod': method,
+        'pathParameters': path,
+        'queryStringParameters': query,
+        'headers': headers,
+        'body': json.dumps(body) if body is not None else None,
+        'requestContext': {
+            'authorizer': {
+                'auth0_user_id': user_id
+            }
+        }
+    }
+
+def serve(event):
+    """
+    Serves 'event' and returns (response, seconds, dynamodb calls, s3 calls).
+    The per-request metric line is captured rather than printed.
+
+    """
+    counter, s3_access = start()
+    import lambda_function
+    dynamodb_calls = counter.calls
+    s3_calls = s3_access.calls
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = lambda_function.lambda_handler(event, None)
+    seconds = time.perf_counter() - start_time
+    return response, seconds, counter.calls - dynamodb_calls, s3_access.calls - s3_calls
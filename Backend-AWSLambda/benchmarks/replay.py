@@ -0,0 +1,219 @@
+"""
+Event Replay
+
+Replays recorded API Gateway proxy events against lambda_handler, at a set
+concurrency and request rate, and reports throughput, latency percentiles
+and error rates by route.
+
+Events are recorded by deploying with IRIS_CAPTURE_EVENTS=1, which logs one
+{"captured_event": ..., "timestamp": ...} line per request, and exporting
+those lines. Any line holding such an object, or a bare event, is read.
+
+Every worker is a process of its own, like a Lambda container, serving one
+request at a time. The workers share one moto server holding a synthetic
+graph (see graph.py). Hosts and users in the recording are mapped
+consistently onto the graph's nodes, except hosts the recording itself
+creates. --keep-ids replays ids as recorded.
+
+Usage: python benchmarks/replay.py EVENTS [--concurrency 4] [--rate 50 |
+       --speed 1.0] [--repeat 1] [--graph 1000] [--keep-ids]
+
+--rate paces requests evenly, --speed keeps their recorded spacing sped up
+by the given factor, and with neither each worker serves as fast as it can.
+"wait" is how late requests started against their schedule; a growing wait
+means the workers, or the moto server, are saturated.
+
+"""
+
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import harness
+
+def read_events(path):
+    """
+    (timestamp or None, event) for every recorded event in 'path'.
+
+    """
+    events = []
+    with open(path) as events_file:
+        for line in events_file:
+            if "{" not in line:
+                continue
+            record = json.loads(line[line.index("{"):])
+            if 'captured_event' in record:
+                events.append((record.get("timestamp"), record["captured_event"]))
+            elif 'resource' in record and 'httpMethod' in record:
+                events.append((None, record))
+    return events
+
+def _body(event):
+    body = event.get("body")
+    if body and event.get("isBase64Encoded"):
+        body = base64.b64decode(body)
+    return json.loads(body) if body else None
+
+def _creates_host(event):
+    return (event["resource"], event["httpMethod"]) == ("/private/hosts", "POST")
+
+def _remap(events, node_ids, seed):
+    """
+    'events' with their host and user ids mapped onto 'node_ids'.
+
+    """
+    import graph
+    rng = random.Random(seed)
+    created_ids = set()
+    for _, event in events:
+        if _creates_host(event) and event.get("body"):
+            created_ids.add(_body(event).get("id"))
+
+    nodes = {}
+    users = {}
+
+    def node(recorded_id):
+        if recorded_id is None or recorded_id in created_ids:
+            return recorded_id
+        if recorded_id not in nodes:
+            nodes[recorded_id] = rng.choice(node_ids)
+        return nodes[recorded_id]
+
+    remapped = []
+    for timestamp, event in events:
+        event = json.loads(json.dumps(event))
+        path = event.get("pathParameters") or {}
+        for name in ("host_id", "entity_id"):
+            if name in path:
+                path[name] = node(path[name])
+        query = event.get("queryStringParameters") or {}
+        if 'filter' in query:
+            query["filter"] = node(query["filter"])
+
+        authorizer = (event.get("requestContext") or {}).get("authorizer") or {}
+        recorded_user_id = authorizer.get("auth0_user_id")
+        host_id = path.get("host_id")
+        if recorded_user_id is not None and not _creates_host(event) and host_id not in created_ids:
+            if host_id is not None:
+                authorizer["auth0_user_id"] = graph.user_id(host_id)
+                users.setdefault(recorded_user_id, authorizer["auth0_user_id"])
+            else:
+                authorizer["auth0_user_id"] = users.setdefault(recorded_user_id, graph.user_id(rng.choice(node_ids)))
+        remapped.append((timestamp, event))
+    return remapped
+
+def _schedule(events, rate, speed, repeat):
+    """
+    (seconds after the start, event) for every request to send.
+
+    """
+    schedule = []
+    timestamps = [timestamp for timestamp, _ in events if timestamp is not None]
+    first = min(timestamps) if timestamps else 0
+    span = (max(timestamps) - first) if timestamps else 0
+    for round_index in range(repeat):
+        for index, (timestamp, event) in enumerate(events):
+            if rate:
+                offset = (round_index * len(events) + index) / rate
+            elif speed and timestamp is not None:
+                offset = (round_index * span + timestamp - first) / speed
+            else:
+                offset = 0
+            schedule.append((offset, event))
+    schedule.sort(key=lambda scheduled: scheduled[0])
+    return schedule
+
+def _worker(endpoint_url, requests, results):
+    harness.start(endpoint_url, create_tables=False)
+    results.put(None)
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+        due, event = request
+        delay = due - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        started = time.time()
+        response, seconds, _, _ = harness.serve(event)
+        results.put((event["httpMethod"] + " " + event["resource"], response["statusCode"],
+                     seconds, max(started - due, 0), started + seconds))
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def _report(results, started):
+    by_route = {}
+    for route, status, seconds, wait, finished in results:
+        by_route.setdefault(route, []).append((status, seconds, wait, finished))
+    by_route["all"] = [result for route_results in list(by_route.values()) for result in route_results]
+
+    print("%-50s %7s %9s %9s %9s %9s %8s %9s" % (
+        "route", "count", "req/s", "p50 ms", "p95 ms", "p99 ms", "errors", "wait p95"))
+    for route, route_results in sorted(by_route.items(), key=lambda item: (item[0] == "all", item[0])):
+        elapsed = max(finished for _, _, _, finished in route_results) - started
+        milliseconds = [seconds * 1000 for _, seconds, _, _ in route_results]
+        errors = sum(1 for status, _, _, _ in route_results if not (200 <= status < 300 or status == 304))
+        print("%-50s %7d %9.1f %9.2f %9.2f %9.2f %7.1f%% %9.2f" % (
+            route, len(route_results), len(route_results) / max(elapsed, 1e-9),
+            _percentile(milliseconds, 0.50), _percentile(milliseconds, 0.95), _percentile(milliseconds, 0.99),
+            100.0 * errors / len(route_results),
+            _percentile([wait * 1000 for _, _, wait, _ in route_results], 0.95)))
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Replay recorded API Gateway events.")
+    parser.add_argument("events")
+    parser.add_argument("--concurrency", type=int, default=4)
+    pacing = parser.add_mutually_exclusive_group()
+    pacing.add_argument("--rate", type=float)
+    pacing.add_argument("--speed", type=float)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--graph", type=int, default=1000)
+    parser.add_argument("--keep-ids", action="store_true")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    endpoint_url = harness.start_server()
+    harness.start(endpoint_url)
+    import constants
+    import graph
+    node_ids = graph.generate(constants.NODE_TABLE, constants.EDGE_TABLE, args.graph, seed=args.seed)
+
+    events = read_events(args.events)
+    if not events:
+        raise Exception("Event Replay: No events in " + args.events)
+    if not args.keep_ids:
+        events = _remap(events, node_ids, args.seed)
+    schedule = _schedule(events, args.rate, args.speed, args.repeat)
+
+    context = multiprocessing.get_context("spawn")
+    requests, results = context.Queue(), context.Queue()
+    workers = [context.Process(target=_worker, args=(endpoint_url, requests, results))
+               for _ in range(args.concurrency)]
+    for worker in workers:
+        worker.start()
+
+    for _ in workers:
+        results.get()
+    started = time.time()
+    for offset, event in schedule:
+        requests.put((started + offset, event))
+    for _ in workers:
+        requests.put(None)
+
+    collected = [results.get() for _ in schedule]
+    for worker in workers:
+        worker.join()
+    _report(collected, started)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,152 @@
+"""
+Change Log
+
+Records which nodes and edges were written or removed so the network map
+can be synced incrementally. Entries live in CHANGE_TABLE, partitioned by
+UTC day:
+
+stream (HASH)  "network#YYYYMMDD"
+stamp (RANGE)  milliseconds since the epoch, zero padded, and a random suffix
+
+Entries expire through the table's TTL on 'expires_at' after RETENTION_DAYS.
+A sync token is an opaque form of a stamp and of a digest of the scope it
+was handed out for, such as a viewport. Changes are only read for a token
+of the same scope. Tokens are handed out CLOCK_SKEW_MS behind the present,
+so entries written by containers whose clocks lag are still read on the
+next sync, at the cost of repeating some.
+
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+import boto3
+from boto3.dynamodb.conditions import Key
+from batch_access import batch_put_items
+
+CHANGE_TABLE = boto3.resource('dynamodb').Table(os.environ.get("IRIS_CHANGE_TABLE", "iris-changes"))
+
+STREAM = "network"
+RETENTION_DAYS = 7
+CLOCK_SKEW_MS = 5000
+MAX_CHANGES = 1000
+
+NODE = "node"
+EDGE = "edge"
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+def _stamp(milliseconds, suffix=""):
+    return "%013d%s" % (milliseconds, suffix)
+
+def _day(milliseconds):
+    return datetime.fromtimestamp(milliseconds / 1000, timezone.utc).date()
+
+def _partition(day):
+    return STREAM + "#" + day.strftime("%Y%m%d")
+
+def _scope_digest(scope):
+    if scope is None:
+        return ""
+    return hashlib.sha256(json.dumps(scope, separators=(",", ":")).encode("utf-8")).hexdigest()[:16]
+
+def _token(stamp, scope):
+    token = stamp
+    digest = _scope_digest(scope)
+    if digest:
+        token += "." + digest
+    return base64.urlsafe_b64encode(token.encode("ascii")).decode("ascii")
+
+def current_token(scope=None):
+    """
+    A token for the present, for reads of 'scope', any JSON value.
+
+    """
+    return _token(_stamp(_now_ms() - CLOCK_SKEW_MS), scope)
+
+def scoped_token(sync_token, scope):
+    """
+    The valid 'sync_token' handed out again for reads of 'scope'.
+
+    """
+    return _token(parse_token(sync_token), scope)
+
+def _parse(sync_token):
+    try:
+        token = base64.urlsafe_b64decode(sync_token.encode("ascii")).decode("ascii")
+    except (AttributeError, ValueError, binascii.Error, UnicodeError):
+        return None
+    stamp, _, digest = token.partition(".")
+    if len(stamp) != 13 or not stamp.isdigit():
+        return None
+    return stamp, digest
+
+def parse_token(sync_token):
+    """
+    The stamp 'sync_token' stands for, or None if it is not a valid token.
+
+    """
+    parsed = _parse(sync_token)
+    return parsed[0] if parsed is not None else None
+
+def _entries(kind, keys, removed):
+    now = _now_ms()
+    expires_at = now // 1000 + RETENTION_DAYS * 24 * 60 * 60
+    entries = []
+    for key in keys:
+        entry = {
+            'stream': _partition(_day(now)),
+            'stamp': _stamp(now, "-" + uuid.uuid4().hex[:12]),
+            'kind': kind,
+            'removed': removed,
+            'expires_at': expires_at
+        }
+        entry.update(key)
+        entries.append(entry)
+    return entries
+
+def record_nodes(node_ids, removed=False):
+    batch_put_items(CHANGE_TABLE, _entries(NODE, [{'node_id': node_id} for node_id in node_ids], removed))
+
+def record_edges(pairs, removed=False):
+    batch_put_items(CHANGE_TABLE, _entries(EDGE, [{'head': head_id, 'tail': tail_id} for head_id, tail_id in pairs], removed))
+
+def changes_since(sync_token, scope=None):
+    """
+    Entries recorded after 'sync_token', oldest first, or None if the token
+    was handed out for another 'scope', is older than the log's retention,
+    or more than MAX_CHANGES entries have been recorded since. Callers should
+    then resend everything.
+
+    """
+    parsed = _parse(sync_token)
+    now = _now_ms()
+    if parsed is None or parsed[1] != _scope_digest(scope):
+        return None
+    stamp = parsed[0]
+    if int(stamp) < now - RETENTION_DAYS * 24 * 60 * 60 * 1000:
+        return None
+
+    changes = []
+    day = _day(int(stamp))
+    while day <= _day(now):
+        kwargs = {
+            'KeyConditionExpression': Key('stream').eq(_partition(day)) & Key('stamp').gt(stamp),
+            'ConsistentRead': True
+        }
+        while True:
+            response = CHANGE_TABLE.query(**kwargs)
+            changes += response["Items"]
+            if len(changes) > MAX_CHANGES:
+                return None
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        day += timedelta(days=1)
+    return changes
@@ -0,0 +1,70 @@
+"""
+Clustering
+
+Merges the triggers and points of a zoomed out map into clusters, so that
+the features returned for a viewport are bounded by its size in pixels
+rather than by the number of nodes in it.
+
+Locations are projected to Web Mercator and bucketed on a grid of square
+cells about CLUSTER_RADIUS pixels wide at the requested zoom. Grid sizes
+are powers of two, so a cell at one level splits into four at the next and
+clusters nest from zoom to zoom like map tiles. A cell holding at least
+MIN_CLUSTER_SIZE features becomes one cluster at their centroid, with their
+count. Clusters are made from the features as the viewer may see them, so
+a cluster never places a node anywhere its own feature would not.
+
+"""
+
+import math
+from api_contract import APIGeoFeatures
+
+TILE_SIZE = 256
+CLUSTER_RADIUS = 64
+MAX_CLUSTER_ZOOM = 16
+MIN_CLUSTER_SIZE = 2
+MAX_LATITUDE = 85.0511
+
+def _level(zoom):
+    return int(math.floor(zoom)) + int(math.log2(TILE_SIZE / CLUSTER_RADIUS))
+
+def _cell(api_location, level):
+    longitude, latitude = api_location
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    x = longitude / 360.0 + 0.5
+    sine = math.sin(math.radians(latitude))
+    y = 0.5 - math.log((1 + sine) / (1 - sine)) / (4 * math.pi)
+    size = 1 << level
+    return min(size - 1, int(x * size)), min(size - 1, int(y * size))
+
+def clusters_zoom(zoom):
+    return zoom is not None and zoom < MAX_CLUSTER_ZOOM
+
+def cluster_features(features, zoom):
+    """
+    A copy of 'features' with its triggers and points clustered for 'zoom'.
+    Geo nodes and members are kept as they are.
+
+    """
+    level = _level(zoom)
+    cells = {}
+    for trigger in features.triggers:
+        cells.setdefault(_cell(trigger[2], level), ([], []))[0].append(trigger)
+    for api_location in features.points:
+        cells.setdefault(_cell(api_location, level), ([], []))[1].append(api_location)
+
+    clustered = APIGeoFeatures()
+    clustered.nodes = features.nodes
+    clustered.members = features.members
+    for cell in sorted(cells):
+        triggers, points = cells[cell]
+        locations = [api_location for _, _, api_location in triggers] + points
+        if len(locations) < MIN_CLUSTER_SIZE:
+            clustered.triggers += triggers
+            clustered.points += points
+            continue
+        centroid = [
+            sum(longitude for longitude, _ in locations) / len(locations),
+            sum(latitude for _, latitude in locations) / len(locations)
+        ]
+        clustered.add_cluster(len(locations), centroid)
+    return clustered
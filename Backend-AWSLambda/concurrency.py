@@ -0,0 +1,42 @@
+"""
+Concurrency
+
+Runs independent I/O calls on a shared thread pool. boto3 clients are safe
+to share between threads, so calls made this way reuse the same clients and
+connection pools as the rest of the request. preconditions gathers checks
+of the same cost this way, so each cost takes about as long as its slowest
+read. gather raises the error of the first failing call in call order, the
+same error the checks would raise run one after another.
+
+Nothing is left running once a handler returns, since Lambda freezes the
+container then, and work started in the background may never finish.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = 8
+
+_executor = None
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    return _executor
+
+def gather(*calls):
+    """
+    Results of the zero-argument 'calls', run concurrently, in call order. 
+    The first exception raised by any call is re-raised once all have ended.
+
+    """
+    if len(calls) <= 1:
+        return [call() for call in calls]
+
+    futures = [_get_executor().submit(call) for call in calls]
+    errors = [future.exception() for future in futures]
+    for error in errors:
+        if error is not None:
+            raise error
+    return [future.result() for future in futures]
@@ -9,30 +9,20 @@ Enforced Preconditions:
 5) There exists a node with an id equal to 'host_id' whose creator is 'user_id' 
 6) If no 'image_id' or 'portal_url' provided, the required 'id' is to be 
    interpreted as an entity id. This entity to host edge must be of weight Peer 
-7) The host has less than 10 drops
+7) The host has less than 10 drops, checked again by the write adding the drop
 
 """
 
 from api_contract import make_APIData, make_APIServerMessage, PEER
-from common import valid_string, valid_canvas_location, valid_host_id, make_node_pkey, make_edge_pkey, get_weight, get_local_drops, query_network_drops
+from common import valid_string, valid_canvas_location, make_node_pkey, make_edge_pkey
+from storage_cache import valid_host_id, get_weight, get_node, get_edge, remember_node, remember_edge, forget_node, forget_edge, VERSION_UPDATE, VERSION_NAMES, VERSION_VALUES
+from batch_access import transact_update_items
+from drop_count import ensure_drop_count, has_drop, MAX_DROPS, ADD_DROP, WITHIN_CAPACITY, STEP_VALUES, CAPACITY_VALUES
+from preconditions import verify, field, OWNER, READ, QUERY
+import adjacency_view
 from constants import NODE_TABLE, EDGE_TABLE
 
 
-def _verify_body_composition(body):
-    drop_id = body["id"]
-    if not valid_string(drop_id):
-        raise Exception("Create Drop: 'id' is invalid")
-
-    location = body["canvas_location"]
-    if not valid_canvas_location(location):
-        raise Exception("Create Drop: 'canvas_location' is invalid")
-
-    if 'image_id' in body and not valid_string(body["image_id"]):
-        raise Exception("Create Drop: 'image_id' is invalid")
-
-    if 'portal_url' in body and not valid_string(body["portal_url"]):
-        raise Exception("Create Drop: 'portal_url' is invalid")
-
 def _verify_user_is_creator(user_id, host_id):
     if not valid_host_id(user_id, host_id):
         raise Exception("Create Drop: User is not the host's creator")
@@ -45,37 +35,88 @@ def _verify_id(host_id, body):
             raise Exception("Create Drop: 'id' is invalid")
 
 def _verify_host_within_capacity(host_id):
-    local_drops = get_local_drops(host_id)
-    network_drops = query_network_drops(host_id)
-    if len(local_drops + network_drops) >= 10:
+    ensure_drop_count(host_id)
+    if get_node(host_id)["drop_count"] >= MAX_DROPS:
         raise Exception("Create Drop: Host has already reached drop capacity")
 
 def _verify(user_id, host_id, body):
-    _verify_body_composition(body)
-    _verify_user_is_creator(user_id, host_id)
-    _verify_id(host_id, body)
-    _verify_host_within_capacity(host_id)
+    verify(
+        field(body, 'id', valid_string, "Create Drop: 'id' is invalid"),
+        field(body, 'canvas_location', valid_canvas_location, "Create Drop: 'canvas_location' is invalid"),
+        field(body, 'image_id', valid_string, "Create Drop: 'image_id' is invalid", required=False),
+        field(body, 'portal_url', valid_string, "Create Drop: 'portal_url' is invalid", required=False),
+        (OWNER, lambda: _verify_user_is_creator(user_id, host_id)),
+        (READ, lambda: _verify_id(host_id, body)),
+        (QUERY, lambda: _verify_host_within_capacity(host_id))
+    )
 
 def _execute_local_drop(node_id, drop):
-    NODE_TABLE.update_item(
-        Key=make_node_pkey(node_id),
-        UpdateExpression='SET drops = list_append(drops, :a)',
-        ExpressionAttributeValues={
-            ':a': [drop]
-        }
-    )
+    try:
+        response = NODE_TABLE.update_item(
+            Key=make_node_pkey(node_id),
+            UpdateExpression='SET drops = list_append(drops, :a), ' + ADD_DROP + ', ' + VERSION_UPDATE,
+            ConditionExpression=WITHIN_CAPACITY,
+            ExpressionAttributeValues={
+                ':a': [drop],
+                **STEP_VALUES,
+                **CAPACITY_VALUES,
+                **VERSION_VALUES
+            },
+            ExpressionAttributeNames=VERSION_NAMES,
+            ReturnValues="ALL_NEW"
+        )
+    except NODE_TABLE.meta.client.exceptions.ConditionalCheckFailedException:
+        raise Exception("Create Drop: Host has already reached drop capacity")
+    remember_node(node_id, response["Attributes"])
+    adjacency_view.update_local_drops(response["Attributes"])
 
 def _execute_network_drop(head_id, tail_id, drop):
-    EDGE_TABLE.update_item(
-        Key=make_edge_pkey(head_id, tail_id),
-        UpdateExpression='SET #D=:a',
-        ExpressionAttributeValues={
-            ':a': drop
-        },
-        ExpressionAttributeNames={
-            "#D": "drop"
-        }
-    )
+    if has_drop(get_edge(head_id, tail_id)):
+        response = EDGE_TABLE.update_item(
+            Key=make_edge_pkey(head_id, tail_id),
+            UpdateExpression='SET #D=:a',
+            ExpressionAttributeValues={
+                ':a': drop
+            },
+            ExpressionAttributeNames={
+                "#D": "drop"
+            },
+            ReturnValues="ALL_NEW"
+        )
+        remember_edge(head_id, tail_id, response["Attributes"])
+        adjacency_view.update_drop(head_id, tail_id, drop)
+        return
+
+    committed = transact_update_items([
+        (EDGE_TABLE, {
+            'Key': make_edge_pkey(head_id, tail_id),
+            'UpdateExpression': 'SET #D=:a',
+            'ConditionExpression': 'attribute_not_exists(#D) OR attribute_type(#D, :null_type)',
+            'ExpressionAttributeValues': {
+                ':a': drop,
+                ':null_type': "NULL"
+            },
+            'ExpressionAttributeNames': {
+                "#D": "drop"
+            }
+        }),
+        (NODE_TABLE, {
+            'Key': make_node_pkey(tail_id),
+            'UpdateExpression': 'SET ' + ADD_DROP + ', ' + VERSION_UPDATE,
+            'ConditionExpression': WITHIN_CAPACITY,
+            'ExpressionAttributeValues': {
+                **STEP_VALUES,
+                **CAPACITY_VALUES,
+                **VERSION_VALUES
+            },
+            'ExpressionAttributeNames': VERSION_NAMES
+        })
+    ])
+    forget_edge(head_id, tail_id)
+    forget_node(tail_id)
+    if not committed:
+        raise Exception("Create Drop: Host has already reached drop capacity")
+    adjacency_view.update_drop(head_id, tail_id, drop)
 
 def execute(user_id, host_id, body):
     _verify(user_id, host_id, body)
@@ -15,9 +15,13 @@ Enforced Preconditions:
 """
 
 from boto3.dynamodb.conditions import Key
-from common import valid_string, valid_location, get_node
+from common import valid_string, valid_location
+from storage_cache import get_node, remember_node, new_version
 from api_contract import make_APIData, make_APIGeoNode, ADMIN
 from constants import NODE_TABLE
+from geo_index import index_attributes
+from change_log import record_nodes
+from preconditions import verify, field, READ, QUERY
 
 INVALID_NAMES = [
     "Iris by Rhizome Networking",
@@ -26,33 +30,8 @@ INVALID_NAMES = [
     "Rhizome Networking LLC"
 ]
 
-def _verify_body_compositon(body):
-    host_id = body["id"]
-    if not valid_string(host_id):
-        raise Exception("Create Host: 'id' is invalid")
-    
-    name = body["name"]
-    if not valid_string(name) or name in INVALID_NAMES:
-        raise Exception("Create Host: 'name' is invalid")
-
-    description = body["description"]
-    if not valid_string(description):
-        raise Exception("Create Host: 'description' is invalid")
-
-    default_location = body["default_location"]
-    if not valid_location(default_location):
-        raise Exception("Create Host: 'default_location' in invalid")
-    
-    if 'live_location' in body and not valid_location(body["live_location"]):
-        raise Exception("Create Host: 'live_location' in invalid")
-
-    portrait_id = body["portrait_id"]
-    if not valid_string(portrait_id):
-        raise Exception("Create Host: 'portrait_id' is invalid")
-
-    supplement_id = body["supplement_id"]
-    if not valid_string(supplement_id):
-        raise Exception("Create Host: 'supplement_id' is invalid")
+def _valid_name(name):
+    return valid_string(name) and name not in INVALID_NAMES
 
 def _verify_user_within_capacity(user_id):
     nodes_of_user = NODE_TABLE.query(
@@ -66,32 +45,48 @@ def _verify_unique_node_id(node_id):
         raise Exception("Create Host: A node with the same id already exists") 
 
 def _verify(user_id, body):
-    _verify_body_compositon(body)
-    _verify_user_within_capacity(user_id)
-    _verify_unique_node_id(body["id"])
+    verify(
+        field(body, 'id', valid_string, "Create Host: 'id' is invalid"),
+        field(body, 'name', _valid_name, "Create Host: 'name' is invalid"),
+        field(body, 'description', valid_string, "Create Host: 'description' is invalid"),
+        field(body, 'default_location', valid_location, "Create Host: 'default_location' in invalid"),
+        field(body, 'live_location', valid_location, "Create Host: 'live_location' in invalid", required=False),
+        field(body, 'portrait_id', valid_string, "Create Host: 'portrait_id' is invalid"),
+        field(body, 'supplement_id', valid_string, "Create Host: 'supplement_id' is invalid"),
+        (READ, lambda: _verify_unique_node_id(body["id"])),
+        (QUERY, lambda: _verify_user_within_capacity(user_id))
+    )
 
 def execute(user_id, body):
     _verify(user_id, body) 
 
     live_location = body["live_location"] if 'live_location' in body else None
-    NODE_TABLE.put_item(
-        Item={
-            'id': body["id"],
-            'name': body["name"],
-            'description': body["description"],
-            'location': {
-                'default_location': body["default_location"],
-                'live_location': live_location,
-            },
-            'zoom': "16",
-            'drops': [],
-            'creator': user_id,
-            'media': {
-                'portrait_id': body["portrait_id"],
-                'supplement_id': body["supplement_id"]
-            }
-        }
-    )
+    location = {
+        'default_location': body["default_location"],
+        'live_location': live_location,
+    }
+    item = {
+        'id': body["id"],
+        'name': body["name"],
+        'description': body["description"],
+        'location': location,
+        'zoom': "16",
+        'drops': [],
+        'drop_count': 0,
+        'creator': user_id,
+        'media': {
+            'portrait_id': body["portrait_id"],
+            'supplement_id': body["supplement_id"]
+        },
+        'version': new_version()
+    }
+    for name, value in index_attributes(location).items():
+        if value is not None:
+            item[name] = value
+
+    NODE_TABLE.put_item(Item=item)
+    remember_node(body["id"], item)
+    record_nodes([body["id"]])
 
     host = get_node(body["id"])
     api_geo_node = make_APIGeoNode(host, ADMIN, ADMIN)
@@ -7,7 +7,11 @@ Enforced Preconditons:
 """
 
 from api_contract import make_APIData, make_APIServerMessage, PEER
-from common import valid_host_id, put_edge
+from storage_cache import valid_host_id
+from batch_access import batch_write_edges
+from change_log import record_edges
+from preconditions import verify, OWNER
+import adjacency_view
 from constants import OFFICER_IDS
 
 def _verify_user_is_creator(user_id, host_id):
@@ -15,7 +19,7 @@ def _verify_user_is_creator(user_id, host_id):
         raise Exception("Create Report: User is not the host's creator")
 
 def _verify(user_id, host_id, entity_id):
-    _verify_user_is_creator(user_id, host_id)
+    verify((OWNER, lambda: _verify_user_is_creator(user_id, host_id)))
 
 def execute(user_id, host_id, entity_id):
     _verify(user_id, host_id, entity_id)
@@ -23,8 +27,12 @@ def execute(user_id, host_id, entity_id):
     if entity_id in OFFICER_IDS:
         return make_APIData(make_APIServerMessage("Successfully Created Report"))
 
+    upserts = []
     for officer_id in OFFICER_IDS:
-        put_edge(officer_id, entity_id, PEER)
-        put_edge(entity_id, officer_id, PEER)
+        upserts.append((officer_id, entity_id, PEER))
+        upserts.append((entity_id, officer_id, PEER))
+    batch_write_edges(upserts)
+    adjacency_view.update_edges(upserts=upserts)
+    record_edges([(head_id, tail_id) for head_id, tail_id, _ in upserts])
 
     return make_APIData(make_APIServerMessage("Successfully Created Report"))
\ No newline at end of file
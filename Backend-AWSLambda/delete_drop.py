@@ -7,51 +7,98 @@ Enforced Preconditions:
 """
 
 from api_contract import make_APIData, make_APIServerMessage
-from common import valid_host_id, make_node_pkey, make_edge_pkey, get_edge, get_local_drops
+from common import make_node_pkey, make_edge_pkey
+from storage_cache import valid_host_id, get_edge, get_local_drops, remember_node, forget_node, forget_edge, VERSION_UPDATE, VERSION_NAMES, VERSION_VALUES
+from batch_access import transact_update_items
+from drop_count import ensure_drop_count, has_drop, REMOVE_DROP, STEP_VALUES
+from concurrency import gather
+from preconditions import verify, OWNER
 import s3_access
+import adjacency_view
 from constants import NODE_TABLE, EDGE_TABLE
 
+MAX_LIFT_ATTEMPTS = 3
+
 
 def _verify_user_is_creator(user_id, host_id):
     if not valid_host_id(user_id, host_id):
         raise Exception("Delete Drop: User is not the host's creator")
 
 def _verify(user_id, host_id):
-    _verify_user_is_creator(user_id, host_id)
+    verify((OWNER, lambda: _verify_user_is_creator(user_id, host_id)))
 
 def _execute_local_lift(node_id, drop_id):
-    filtered_drops = []
-    for drop in get_local_drops(node_id):
-        if drop["id"] != drop_id:
-            filtered_drops.append(drop)
-        elif "image_id" in drop:
-            s3_access.delete_object(drop["image_id"])
-    
-    NODE_TABLE.update_item(
-        Key=make_node_pkey(node_id),
-        UpdateExpression='SET drops = :a',
-        ExpressionAttributeValues={
-            ':a': filtered_drops
-        }
-    )
+    for _ in range(MAX_LIFT_ATTEMPTS):
+        local_drops = get_local_drops(node_id)
+        index = next((index for index, drop in enumerate(local_drops) if drop["id"] == drop_id), None)
+        if index is None:
+            return
+
+        try:
+            response = NODE_TABLE.update_item(
+                Key=make_node_pkey(node_id),
+                UpdateExpression='REMOVE drops[%d] SET %s, %s' % (index, REMOVE_DROP, VERSION_UPDATE),
+                ConditionExpression='drops[%d].id = :drop_id' % index,
+                ExpressionAttributeValues={
+                    ':drop_id': drop_id,
+                    **STEP_VALUES,
+                    **VERSION_VALUES
+                },
+                ExpressionAttributeNames=VERSION_NAMES,
+                ReturnValues="ALL_NEW"
+            )
+        except NODE_TABLE.meta.client.exceptions.ConditionalCheckFailedException:
+            forget_node(node_id)
+            continue
+
+        remember_node(node_id, response["Attributes"])
+        calls = [lambda: adjacency_view.update_local_drops(response["Attributes"])]
+        image_id = local_drops[index].get("image_id")
+        if image_id is not None:
+            calls.append(lambda: s3_access.delete_object(image_id))
+        gather(*calls)
+        return
+
+    raise Exception("Delete Drop: Drops were changed concurrently")
 
 def _execute_network_lift(head_id, tail_id):
-    EDGE_TABLE.update_item(
-        Key=make_edge_pkey(head_id, tail_id),
-        UpdateExpression='SET #D=:a',
-        ExpressionAttributeValues={
-            ':a': None
-        },
-        ExpressionAttributeNames={
-            "#D": "drop"
-        }
-    )
+    transact_update_items([
+        (EDGE_TABLE, {
+            'Key': make_edge_pkey(head_id, tail_id),
+            'UpdateExpression': 'SET #D=:a',
+            'ConditionExpression': 'attribute_type(#D, :map_type)',
+            'ExpressionAttributeValues': {
+                ':a': None,
+                ':map_type': "M"
+            },
+            'ExpressionAttributeNames': {
+                "#D": "drop"
+            }
+        }),
+        (NODE_TABLE, {
+            'Key': make_node_pkey(tail_id),
+            'UpdateExpression': 'SET ' + REMOVE_DROP + ', ' + VERSION_UPDATE,
+            'ExpressionAttributeValues': {
+                **STEP_VALUES,
+                **VERSION_VALUES
+            },
+            'ExpressionAttributeNames': VERSION_NAMES
+        })
+    ])
+    forget_edge(head_id, tail_id)
+    forget_node(tail_id)
+    adjacency_view.update_drop(head_id, tail_id, None)
 
 def execute(user_id, host_id, drop_id):
     _verify(user_id, host_id)
 
-    if get_edge(drop_id, host_id) is not None:
-        _execute_network_lift(drop_id, host_id)
+    _, edge = gather(
+        lambda: ensure_drop_count(host_id),
+        lambda: get_edge(drop_id, host_id)
+    )
+    if edge is not None:
+        if has_drop(edge):
+            _execute_network_lift(drop_id, host_id)
     else:
         _execute_local_lift(host_id, drop_id)
 
@@ -7,9 +7,17 @@ Enforced Preconditions:
 """
 
 from api_contract import make_APIData, make_APIServerMessage
-from common import valid_host_id, make_node_pkey, get_node, delete_edge, query_edges_by_head, query_edges_by_tail
+from common import make_node_pkey
+from storage_cache import valid_host_id, get_node, remember_node
+from batch_access import batch_delete_edges
+from concurrency import gather
+from preconditions import verify, OWNER
+from pagination import iter_items, edges_by_head, edges_by_tail
+from change_log import record_nodes, record_edges
+from drop_count import release_network_drops
+import adjacency_view
 import s3_access
-from constants import NODE_TABLE
+from constants import NODE_TABLE, EDGE_TABLE
 
 
 def _verify_user_is_creator(user_id, host_id):
@@ -17,25 +25,29 @@ def _verify_user_is_creator(user_id, host_id):
         raise Exception("Delete Host: User is not the host's creator")
 
 def _verify(user_id, host_id):
-    _verify_user_is_creator(user_id, host_id)
+    verify((OWNER, lambda: _verify_user_is_creator(user_id, host_id)))
 
 def execute(user_id, host_id):
     _verify(user_id, host_id)
 
     host = get_node(host_id)
-    s3_access.delete_object(host["media"]["portrait_id"])
-    s3_access.delete_object(host["media"]["supplement_id"])
-
     NODE_TABLE.delete_item(
         Key=make_node_pkey(host_id)
     )
+    remember_node(host_id, None)
 
-    to_host_edges = query_edges_by_head(host_id)
-    from_host_edges = query_edges_by_tail(host_id)
+    _, _, to_host_edges, from_host_edges = gather(
+        lambda: s3_access.delete_object(host["media"]["portrait_id"]),
+        lambda: s3_access.delete_object(host["media"]["supplement_id"]),
+        lambda: list(iter_items(EDGE_TABLE.query, edges_by_head(host_id))),
+        lambda: list(iter_items(EDGE_TABLE.query, edges_by_tail(host_id)))
+    )
 
-    for edge in (to_host_edges + from_host_edges):
-        delete_edge(edge["head"], edge["tail"])
+    pairs = [(edge["head"], edge["tail"]) for edge in (to_host_edges + from_host_edges)]
+    batch_delete_edges(pairs)
+    release_network_drops(to_host_edges)
+    adjacency_view.invalidate_views([host_id] + [node_id for pair in pairs for node_id in pair])
+    record_nodes([host_id], removed=True)
+    record_edges(pairs, removed=True)
 
     return make_APIData(make_APIServerMessage("Successfully deleted host"))
-
-    
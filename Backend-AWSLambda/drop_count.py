@@ -0,0 +1,78 @@
+"""
+Drop Count
+
+Every node keeps a 'drop_count' of its local drops and of the network drops
+on edges towards it, so that create_drop can check the node's capacity and
+add a drop in a single conditional write. Writes adding or removing a drop
+adjust the count in the same UpdateItem, or in the same transaction when
+the drop lives on an edge.
+
+Nodes created before the count existed are counted on first use.
+
+"""
+
+from collections import Counter
+from common import make_node_pkey
+from storage_cache import get_node, remember_node, forget_node, VERSION_UPDATE, VERSION_NAMES, VERSION_VALUES
+from pagination import iter_items, network_drops_by_tail
+from constants import NODE_TABLE, EDGE_TABLE
+
+MAX_DROPS = 10
+
+ADD_DROP = "drop_count = drop_count + :drop_step"
+REMOVE_DROP = "drop_count = drop_count - :drop_step"
+WITHIN_CAPACITY = "drop_count < :max_drops"
+STEP_VALUES = {":drop_step": 1}
+CAPACITY_VALUES = {":max_drops": MAX_DROPS}
+
+def has_drop(edge):
+    return edge is not None and isinstance(edge.get("drop"), dict)
+
+def ensure_drop_count(node_id):
+    """
+    Writes the 'drop_count' of a node created before it was maintained.
+
+    """
+    node = get_node(node_id)
+    if node is None or 'drop_count' in node:
+        return
+
+    count = len(node["drops"]) + sum(1 for _ in iter_items(EDGE_TABLE.query, network_drops_by_tail(node_id)))
+    try:
+        response = NODE_TABLE.update_item(
+            Key=make_node_pkey(node_id),
+            UpdateExpression="SET drop_count = :drop_count, " + VERSION_UPDATE,
+            ConditionExpression="attribute_exists(id) AND attribute_not_exists(drop_count)",
+            ExpressionAttributeValues={
+                ':drop_count': count,
+                **VERSION_VALUES
+            },
+            ExpressionAttributeNames=VERSION_NAMES,
+            ReturnValues="ALL_NEW"
+        )
+        remember_node(node_id, response["Attributes"])
+    except NODE_TABLE.meta.client.exceptions.ConditionalCheckFailedException:
+        forget_node(node_id)
+
+def release_network_drops(edges):
+    """
+    Lowers the drop count of the tail of every edge in 'edges' that carried
+    a drop. Call once the edges have been deleted.
+
+    """
+    counts = Counter(edge["tail"] for edge in edges if has_drop(edge))
+    for tail_id, count in counts.items():
+        try:
+            NODE_TABLE.update_item(
+                Key=make_node_pkey(tail_id),
+                UpdateExpression="SET drop_count = drop_count - :drop_step, " + VERSION_UPDATE,
+                ConditionExpression="attribute_exists(drop_count)",
+                ExpressionAttributeValues={
+                    ':drop_step': count,
+                    **VERSION_VALUES
+                },
+                ExpressionAttributeNames=VERSION_NAMES
+            )
+        except NODE_TABLE.meta.client.exceptions.ConditionalCheckFailedException:
+            pass
+        forget_node(tail_id)
@@ -0,0 +1,240 @@
+"""
+Geo Index
+
+Nodes are indexed by the geohash of their locations so that the map can be
+read one viewport at a time. Two sparse global secondary indexes on the node
+table back the lookups:
+
+geohash-index       geohash_cell (HASH), geohash (RANGE)       default location
+live-geohash-index  live_geohash_cell (HASH), live_geohash (RANGE)  live location
+
+'geohash_cell' is the leading CELL_PRECISION characters of 'geohash' and
+spreads the index across partitions. A node without a live location carries
+no live attributes and therefore does not appear in the live index.
+
+"""
+
+import math
+from boto3.dynamodb.conditions import Key
+from common import make_node_pkey
+from constants import NODE_TABLE
+from pagination import iter_items
+
+GEOHASH_INDEX = "geohash-index"
+LIVE_GEOHASH_INDEX = "live-geohash-index"
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+CELL_PRECISION = 2
+MAX_CELL_QUERIES = 16
+
+def encode(longitude, latitude, precision=GEOHASH_PRECISION):
+    lon_range = [-180.0, 180.0]
+    lat_range = [-90.0, 90.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            bounds[0] = mid
+        else:
+            bits = bits << 1
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(geohash)
+
+def _cell_size(precision):
+    lon_bits = math.ceil(5 * precision / 2)
+    lat_bits = math.floor(5 * precision / 2)
+    return 360.0 / (1 << lon_bits), 180.0 / (1 << lat_bits)
+
+def _steps(start, stop, size):
+    values = []
+    value = start
+    while value < stop:
+        values.append(value)
+        value += size
+    values.append(stop)
+    return values
+
+def split_antimeridian(bbox):
+    west, south, east, north = bbox
+    if west <= east:
+        return [bbox]
+    return [(west, south, 180.0, north), (-180.0, south, east, north)]
+
+def _cells(bbox, precision):
+    width, height = _cell_size(precision)
+    cells = set()
+    for west, south, east, north in split_antimeridian(bbox):
+        for latitude in _steps(south, north, height):
+            for longitude in _steps(west, east, width):
+                cells.add(encode(min(longitude, 180.0 - 1e-9), min(latitude, 90.0 - 1e-9), precision))
+    return cells
+
+def _zoom_precision(zoom):
+    if zoom is None:
+        return GEOHASH_PRECISION
+    return max(CELL_PRECISION, min(GEOHASH_PRECISION, int(zoom) // 2 + 1))
+
+def covering_cells(bbox, zoom=None):
+    """
+    Geohash prefixes covering 'bbox', as fine as 'zoom' suggests while staying
+    within MAX_CELL_QUERIES, or None if even the coarsest cells are too many.
+
+    """
+    precision = _zoom_precision(zoom)
+    while precision >= CELL_PRECISION:
+        width, height = _cell_size(precision)
+        west, south, east, north = bbox
+        span = (east - west) % 360.0 if west != east else 0.0
+        estimate = (span / width + 2) * ((north - south) / height + 2)
+        if estimate <= 4 * MAX_CELL_QUERIES:
+            cells = _cells(bbox, precision)
+            if len(cells) <= MAX_CELL_QUERIES:
+                return sorted(cells)
+        precision -= 1
+    return None
+
+def parse_bbox(raw_bbox):
+    try:
+        west, south, east, north = [float(value) for value in raw_bbox.split(",")]
+    except (AttributeError, ValueError):
+        return None
+    if not (-180 <= west <= 180 and -180 <= east <= 180):
+        return None
+    if not (-90 <= south <= north <= 90):
+        return None
+    return (west, south, east, north)
+
+def parse_zoom(raw_zoom):
+    try:
+        zoom = float(raw_zoom)
+    except (TypeError, ValueError):
+        return None
+    return zoom if 0 <= zoom <= 24 else None
+
+def contains(bbox, api_location):
+    longitude, latitude = api_location
+    return any(
+        west <= longitude <= east and south <= latitude <= north
+        for west, south, east, north in split_antimeridian(bbox)
+    )
+
+def index_attributes(location):
+    """
+    Index attributes for a node's 'location'. Live attributes are None when
+    the node has no live location and should then be removed from the item.
+
+    """
+    default_location = location["default_location"]
+    geohash = encode(float(default_location[0]), float(default_location[1]))
+    attributes = {
+        'geohash_cell': geohash[:CELL_PRECISION],
+        'geohash': geohash
+    }
+    attributes.update(live_index_attributes(location["live_location"]))
+    return attributes
+
+def live_index_attributes(live_location):
+    """
+    The live half of index_attributes, for updates of the live location alone.
+
+    """
+    if live_location is None:
+        return {'live_geohash_cell': None, 'live_geohash': None}
+    live_geohash = encode(float(live_location[0]), float(live_location[1]))
+    return {'live_geohash_cell': live_geohash[:CELL_PRECISION], 'live_geohash': live_geohash}
+
+def _cell_source(index_name, cell_attribute, hash_attribute, cell):
+    key_condition = Key(cell_attribute).eq(cell[:CELL_PRECISION])
+    if len(cell) > CELL_PRECISION:
+        key_condition = key_condition & Key(hash_attribute).begins_with(cell)
+    return {'IndexName': index_name, 'KeyConditionExpression': key_condition}
+
+def node_sources(bbox, zoom=None):
+    """
+    The NODE_TABLE queries, see pagination, whose nodes may fall inside
+    'bbox', or None if the viewport is too large to be served from the index.
+    A node can be returned by more than one of them.
+
+    """
+    cells = covering_cells(bbox, zoom)
+    if cells is None:
+        return None
+
+    sources = []
+    for cell in cells:
+        sources.append(_cell_source(GEOHASH_INDEX, 'geohash_cell', 'geohash', cell))
+        sources.append(_cell_source(LIVE_GEOHASH_INDEX, 'live_geohash_cell', 'live_geohash', cell))
+    return sources
+
+def query_nodes(bbox, zoom=None):
+    """
+    Nodes whose default or live location may fall inside 'bbox'. Callers must
+    still check the location they display, since which of the two is shown
+    depends on the viewer. Returns None if the viewport is too large to be
+    served from the index.
+
+    """
+    sources = node_sources(bbox, zoom)
+    if sources is None:
+        return None
+
+    nodes = {}
+    for source in sources:
+        for node in iter_items(NODE_TABLE.query, source):
+            nodes[node["id"]] = node
+    return list(nodes.values())
+
+def backfill():
+    """
+    Writes index attributes onto nodes created before the index existed.
+
+    """
+    for node in iter_items(NODE_TABLE.scan, {}):
+        if 'geohash' not in node:
+            update_index(node["id"], node["location"])
+
+def update_expression(location):
+    """
+    SET and REMOVE clauses, with their values, that keep the index attributes
+    of a node in step with 'location'.
+
+    """
+    return _update_clauses(index_attributes(location))
+
+def live_update_expression(live_location):
+    return _update_clauses(live_index_attributes(live_location))
+
+def _update_clauses(attributes):
+    set_clauses = []
+    remove_clauses = []
+    values = {}
+    for name, value in attributes.items():
+        if value is None:
+            remove_clauses.append(name)
+        else:
+            set_clauses.append(name + "=:" + name)
+            values[":" + name] = value
+    return set_clauses, remove_clauses, values
+
+def update_index(node_id, location):
+    set_clauses, remove_clauses, values = update_expression(location)
+    expression = "SET " + ", ".join(set_clauses)
+    if remove_clauses:
+        expression += " REMOVE " + ", ".join(remove_clauses)
+    NODE_TABLE.update_item(
+        Key=make_node_pkey(node_id),
+        UpdateExpression=expression,
+        ExpressionAttributeValues=values
+    )
@@ -0,0 +1,113 @@
+"""
+Instrumentation
+
+Per-request timings and storage call counts, emitted as one JSON log line
+per request:
+
+{"metric": "route", "route": "GET /private/hosts", "status": 200,
+ "latency_ms": ..., "verify_ms": ..., "execute_ms": ...,
+ "dynamodb_calls": ..., "s3_calls": ...}
+
+Calls are counted from botocore's 'before-call' event, so retries within a
+call are not counted again and presigned URLs, which are signed locally,
+are not counted at all.
+
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+COUNTED_SERVICES = ("dynamodb", "s3")
+
+_lock = threading.Lock()
+_record = None
+_installed = False
+
+def _count_call(model, **kwargs):
+    service_name = model.service_model.service_name
+    with _lock:
+        if _record is not None and service_name in COUNTED_SERVICES:
+            _record[service_name + "_calls"] += 1
+
+def _add(name, value):
+    with _lock:
+        if _record is not None:
+            _record[name] = _record.get(name, 0) + value
+
+def install():
+    """
+    Registers the call counter on boto3's default session. Clients copy the
+    session's handlers when they are created, so this must run before the
+    handler modules create their tables and clients.
+
+    """
+    global _installed
+    if _installed:
+        return
+    import boto3
+    if boto3.DEFAULT_SESSION is None:
+        boto3.setup_default_session()
+    boto3.DEFAULT_SESSION.events.register('before-call', _count_call, unique_id='iris-instrumentation')
+    _installed = True
+
+def instrument_handler(module):
+    """
+    Times the handler's '_verify' separately from the rest of its execute.
+
+    """
+    verify = getattr(module, "_verify", None)
+    if verify is None or getattr(verify, "instrumented", False):
+        return
+
+    def timed_verify(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return verify(*args, **kwargs)
+        finally:
+            _add("verify_ms", (time.perf_counter() - start) * 1000)
+
+    timed_verify.instrumented = True
+    module._verify = timed_verify
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add(name + "_ms", (time.perf_counter() - start) * 1000)
+
+def _emit(record):
+    handler_ms = record.pop("handler_ms", 0)
+    verify_ms = record.get("verify_ms", 0)
+    record["verify_ms"] = round(verify_ms, 3)
+    record["execute_ms"] = round(max(handler_ms - verify_ms, 0), 3)
+    for name in list(record):
+        if name.endswith("_ms") and isinstance(record[name], float):
+            record[name] = round(record[name], 3)
+    print(json.dumps(record))
+
+def middleware(event, call_next):
+    global _record
+    with _lock:
+        _record = {
+            'metric': "route",
+            'route': event["httpMethod"] + " " + event["resource"],
+            'status': 500,
+            'dynamodb_calls': 0,
+            's3_calls': 0
+        }
+
+    start = time.perf_counter()
+    try:
+        response = call_next(event)
+        _record["status"] = response["statusCode"]
+        return response
+    finally:
+        with _lock:
+            record = _record
+            _record = None
+        record["latency_ms"] = (time.perf_counter() - start) * 1000
+        _emit(record)
@@ -1,93 +1,295 @@
+import base64
+import builtins
+import functools
+import gzip
+import hashlib
+import importlib
 import json
 import logging
+import os
+import sys
+import time
+import instrumentation
 
-import read_organizations
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-import create_host
-import read_hosts
-import update_host
-import delete_host
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
 
-import read_network
-import pull_trigger
-import update_network
+COLD_START_PROFILE = os.environ.get("IRIS_COLD_START_PROFILE") == "1"
+PRELOAD_HANDLERS = os.environ.get("IRIS_PRELOAD_HANDLERS", "")
+CAPTURE_EVENTS = os.environ.get("IRIS_CAPTURE_EVENTS") == "1"
 
-import create_drop
-import read_drops
-import delete_drop
+# Parts of the event benchmarks/replay.py needs, and headers never captured.
+CAPTURED_FIELDS = ('resource', 'httpMethod', 'pathParameters', 'queryStringParameters', 'headers', 'body', 'isBase64Encoded')
+REDACTED_HEADERS = ('authorization', 'cookie')
 
-import create_report
+# Bodies smaller than this are sent uncompressed, as compressing them saves
+# less than it costs. Brotli is offered only where the module is installed.
+# Compressed and packed bodies are returned base64-encoded, which API Gateway
+# only decodes to binary when the REST API's binaryMediaTypes include "*/*".
+# With that setting it base64-encodes request bodies too, see _request_body.
+COMPRESSION_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
 
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+def _query_parameter(query_parameters, name):
+    return query_parameters[name] if query_parameters is not None and name in query_parameters else None
 
-def serve(event):
-    print(event["httpMethod"] + " " + event["resource"])
+def _header(event, name):
+    headers = event.get('headers') or {}
+    for header_name, value in headers.items():
+        if header_name.lower() == name.lower():
+            return value
+    return None
+
+def _request_body(event):
+    body = event.get('body')
+    if body is None:
+        return None
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body)
+    return json.loads(body)
+
+def _compress_gzip(body):
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+def _compress_brotli(body):
+    return brotli.compress(body, quality=BROTLI_QUALITY)
+
+# Content codings by preference, with their compressors.
+ENCODINGS = [("br", _compress_brotli)] if brotli is not None else []
+ENCODINGS.append(("gzip", _compress_gzip))
+
+def _content_encoding(accept_encoding, size):
+    """
+    The preferred coding in ENCODINGS the client accepts, or None if the body
+    should be sent as it is.
+
+    """
+    if accept_encoding is None or size < COMPRESSION_MIN_BYTES:
+        return None
+    weights = {}
+    for coding in accept_encoding.split(","):
+        name, _, parameters = coding.partition(";")
+        weight = 1.0
+        parameter, _, value = parameters.partition("=")
+        if parameter.strip().lower() == "q":
+            try:
+                weight = float(value)
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    accepted = [(weights.get(name, weights.get("*", 0.0)), -rank, name, compress)
+                for rank, (name, compress) in enumerate(ENCODINGS)]
+    weight, _, name, compress = max(accepted)
+    return (name, compress) if weight > 0 else None
+
+def _entity_tag(digest):
+    return 'W/"' + digest.hexdigest()[:32] + '"'
+
+def _none_match(if_none_match, entity_tag):
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = entity_tag[2:]
+    return any(tag.strip().replace("W/", "", 1) == opaque_tag for tag in if_none_match.split(","))
+
+# (resource, method) -> (handler module, arguments of its execute)
+ROUTES = {
+    ("/public/organizations", "GET"): (
+        "read_organizations", lambda user_id, path, query, body: ()),
+    ("/private/hosts", "GET"): (
+        "read_hosts", lambda user_id, path, query, body: (user_id,)),
+    ("/private/hosts", "POST"): (
+        "create_host", lambda user_id, path, query, body: (user_id, body)),
+    ("/private/hosts/{host_id}", "PATCH"): (
+        "update_host", lambda user_id, path, query, body: (user_id, path["host_id"], body)),
+    ("/private/hosts/{host_id}/live_location", "PUT"): (
+        "update_live_location", lambda user_id, path, query, body: (user_id, path["host_id"], body)),
+    ("/private/hosts/{host_id}", "DELETE"): (
+        "delete_host", lambda user_id, path, query, body: (user_id, path["host_id"])),
+    ("/private/hosts/{host_id}/network", "GET"): (
+        "read_network", lambda user_id, path, query, body: (
+            user_id, path["host_id"], _query_parameter(query, "filter"),
+            _query_parameter(query, "bbox"), _query_parameter(query, "zoom"),
+            _query_parameter(query, "sync_token"), _query_parameter(query, "page_size"),
+            _query_parameter(query, "page_token"))),
+    ("/private/hosts/{host_id}/network", "PATCH"): (
+        "update_network", lambda user_id, path, query, body: (user_id, path["host_id"], query["filter"], body)),
+    ("/private/hosts/{host_id}/network/triggers", "POST"): (
+        "pull_trigger", lambda user_id, path, query, body: (user_id, path["host_id"], body)),
+    ("/private/hosts/{host_id}/drops", "GET"): (
+        "read_drops", lambda user_id, path, query, body: (
+            user_id, path["host_id"], _query_parameter(query, "filter"),
+            _query_parameter(query, "page_size"), _query_parameter(query, "page_token"))),
+    ("/private/hosts/{host_id}/drops", "POST"): (
+        "create_drop", lambda user_id, path, query, body: (user_id, path["host_id"], body)),
+    ("/private/hosts/{host_id}/drops/{drop_id}", "DELETE"): (
+        "delete_drop", lambda user_id, path, query, body: (user_id, path["host_id"], path["drop_id"])),
+    ("/private/hosts/{host_id}/reports/{entity_id}", "POST"): (
+        "create_report", lambda user_id, path, query, body: (user_id, path["host_id"], path["entity_id"])),
+}
+
+# Seconds a warm-container node may go unchecked on each route, see
+# storage_cache. Routes not listed check every cached node's version.
+NODE_STALENESS_BUDGETS = {
+    ("/private/hosts/{host_id}/network", "GET"): 30,
+    ("/private/hosts/{host_id}/drops", "GET"): 10,
+}
+
+def _profiled_import(module_name):
+    """
+    Imports 'module_name' and logs how long it, and every module it imported
+    for the first time, took to import. Times include nested imports.
+
+    """
+    timings = {}
+    original_import = builtins.__import__
+
+    def timed_import(name, *args, **kwargs):
+        if name in sys.modules:
+            return original_import(name, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return original_import(name, *args, **kwargs)
+        finally:
+            timings.setdefault(name, round((time.perf_counter() - start) * 1000, 3))
+
+    builtins.__import__ = timed_import
+    start = time.perf_counter()
+    try:
+        module = importlib.import_module(module_name)
+    finally:
+        builtins.__import__ = original_import
+
+    logger.info(json.dumps({
+        'cold_start_import': module_name,
+        'milliseconds': round((time.perf_counter() - start) * 1000, 3),
+        'modules': timings
+    }))
+    return module
+
+def _load_handler(module_name):
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    instrumentation.install()
+    if COLD_START_PROFILE:
+        module = _profiled_import(module_name)
+    else:
+        module = importlib.import_module(module_name)
+    instrumentation.instrument_handler(module)
+    return module
+
+def _discard_request_cache(event, call_next):
+    try:
+        return call_next(event)
+    finally:
+        storage_cache = sys.modules.get("storage_cache")
+        if storage_cache is not None:
+            storage_cache.clear()
+
+def _capture_event(event, call_next):
+    captured = {name: event.get(name) for name in CAPTURED_FIELDS}
+    captured['headers'] = {
+        name: value for name, value in (event.get('headers') or {}).items() if name.lower() not in REDACTED_HEADERS
+    }
+    captured['requestContext'] = {
+        'authorizer': (event.get('requestContext') or {}).get('authorizer')
+    }
+    print(json.dumps({'captured_event': captured, 'timestamp': time.time()}))
+    return call_next(event)
+
+# Each middleware is called as middleware(event, call_next) and returns the
+# response, outermost first.
+MIDDLEWARE = [
+    instrumentation.middleware,
+    _discard_request_cache
+]
+if CAPTURE_EVENTS:
+    MIDDLEWARE.insert(0, _capture_event)
+
+def _dispatch(event):
     resource = event['resource']
     method = event['httpMethod']
     path_parameters = event['pathParameters']
     query_parameters = event['queryStringParameters']
 
-    body = None 
-    if 'body' in event and event['body'] is not None:
-        body = json.loads(event['body'])
-    
-    statusCode = 200
-    response = None
+    body = _request_body(event)
 
-    if resource == "/public/organizations" and method == "GET":
+    route = ROUTES.get((resource, method))
+    if route is None:
         return {
-            'statusCode': statusCode,
-            'body': json.dumps(read_organizations.execute())
+            'statusCode': 404,
+            'body': json.dumps({
+                'message': "Resource not found"
+            })
         }
 
-    auth0_user_id = event['requestContext']['authorizer']['auth0_user_id']
-    print("Auth0 User ID: " + auth0_user_id)
-    if resource == "/private/hosts" and method == "GET":
-        response = read_hosts.execute(auth0_user_id)
-
-    elif resource == "/private/hosts" and method == "POST":
-        response = create_host.execute(auth0_user_id, body)
-    
-    elif resource == "/private/hosts/{host_id}" and method == "PATCH":
-        response = update_host.execute(auth0_user_id, path_parameters["host_id"], body)
-    
-    elif resource == "/private/hosts/{host_id}" and method == "DELETE":
-        response = delete_host.execute(auth0_user_id, path_parameters["host_id"])
-
-    elif resource == "/private/hosts/{host_id}/network" and method == "GET":
-        entity_id = query_parameters["filter"] if query_parameters is not None and 'filter' in query_parameters else None
-        response = read_network.execute(auth0_user_id, path_parameters["host_id"], entity_id)
-
-    elif resource == "/private/hosts/{host_id}/network" and method == "PATCH":
-        response = update_network.execute(auth0_user_id, path_parameters["host_id"], query_parameters["filter"], body)
-
-    elif resource == "/private/hosts/{host_id}/network/triggers" and method == "POST":
-        response = pull_trigger.execute(auth0_user_id, path_parameters["host_id"], body)
-
-    elif resource == "/private/hosts/{host_id}/drops" and method == "GET":
-        entity_id = query_parameters["filter"] if query_parameters is not None and 'filter' in query_parameters else None
-        response = read_drops.execute(auth0_user_id, path_parameters["host_id"], entity_id)
-    
-    elif resource == "/private/hosts/{host_id}/drops" and method == "POST":
-        response = create_drop.execute(auth0_user_id, path_parameters["host_id"], body)
-    
-    elif resource == "/private/hosts/{host_id}/drops/{drop_id}" and method == "DELETE":
-        response = delete_drop.execute(auth0_user_id, path_parameters["host_id"], path_parameters["drop_id"])
-
-    elif resource == "/private/hosts/{host_id}/reports/{entity_id}" and method == "POST":
-        response = create_report.execute(auth0_user_id, path_parameters["host_id"], path_parameters["entity_id"])
+    auth0_user_id = None
+    if not resource.startswith("/public/"):
+        auth0_user_id = event['requestContext']['authorizer']['auth0_user_id']
 
-    else:
-        statusCode = 404
-        response = {
-            'message': "Resource not found"
-        }
+    module_name, make_arguments = route
+    handler = _load_handler(module_name)
+    storage_cache = sys.modules.get("storage_cache")
+    if storage_cache is not None:
+        storage_cache.set_staleness_budget(NODE_STALENESS_BUDGETS.get((resource, method), 0))
+    with instrumentation.phase("handler"):
+        response = handler.execute(*make_arguments(auth0_user_id, path_parameters, query_parameters, body))
+
+    # Imported here, as it pulls in api_contract and with it s3_access, which
+    # must not create its client before instrumentation is installed.
+    import api_serializer
+    digest = hashlib.sha256()
+    synced = _query_parameter(query_parameters, "sync_token") is not None
+    body, content_type = api_serializer.negotiate(response, _header(event, "Accept"), digest, synced)
+    headers = {}
+    vary = []
+    if content_type != api_serializer.JSON_TYPE:
+        headers['Content-Type'] = content_type
+        vary.append("Accept")
+
+    encoding = _content_encoding(_header(event, "Accept-Encoding"), len(body))
+    if encoding is not None:
+        vary.append("Accept-Encoding")
+    if vary:
+        headers['Vary'] = ", ".join(vary)
+
+    if method == "GET":
+        headers['ETag'] = _entity_tag(digest)
+        if _none_match(_header(event, "If-None-Match"), headers['ETag']):
+            return {
+                'statusCode': 304,
+                'headers': headers
+            }
 
-    return {
-        'statusCode': statusCode,
-        'body': json.dumps(response)
+    if encoding is not None:
+        name, compress = encoding
+        body = compress(body)
+        headers['Content-Encoding'] = name
+
+    served = {
+        'statusCode': 200
     }
+    if headers:
+        served['headers'] = headers
+    if encoding is not None or content_type != api_serializer.JSON_TYPE:
+        served['isBase64Encoded'] = True
+        served['body'] = base64.b64encode(body).decode("ascii")
+    else:
+        served['body'] = body.decode("utf-8")
+    return served
+
+def serve(event):
+    call = _dispatch
+    for middleware in reversed(MIDDLEWARE):
+        call = functools.partial(middleware, call_next=call)
+    return call(event)
 
 def lambda_handler(event, context):
     try:
@@ -102,3 +304,6 @@ def lambda_handler(event, context):
             'statusCode': 500,
             'body': json.dumps(response)
         }
+
+for module_name in filter(None, map(str.strip, PRELOAD_HANDLERS.split(","))):
+    _load_handler(module_name)
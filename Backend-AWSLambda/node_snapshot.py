@@ -0,0 +1,173 @@
+"""
+Node Snapshot
+
+An optional warm-container copy of the map attributes of every node, held
+in columnar NumPy arrays so that the whole network can be selected and
+placed with vectorized operations rather than a node at a time. Enabled by
+IRIS_NODE_SNAPSHOT=1 where numpy is installed, and unused otherwise.
+
+ids, creators                  object arrays
+longitudes, latitudes          default location
+live_longitudes, ...           live location, NaN where there is none
+zooms                          float64
+present                        False on rows of removed nodes
+
+A snapshot is loaded by one scan of NODE_TABLE and then kept current from
+the change log: at most every SNAPSHOT_REFRESH seconds, the nodes recorded
+as changed since the previous refresh are read again. It is loaded afresh
+when the log can no longer tell what changed.
+
+"""
+
+import os
+import threading
+import time
+from api_contract import ADMIN, PEER
+from batch_access import batch_get_nodes
+from change_log import current_token, changes_since, NODE
+from geo_index import split_antimeridian
+from pagination import iter_items
+from constants import NODE_TABLE
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SNAPSHOT_ENABLED = numpy is not None and os.environ.get("IRIS_NODE_SNAPSHOT") == "1"
+SNAPSHOT_REFRESH = float(os.environ.get("IRIS_NODE_SNAPSHOT_REFRESH", "5"))
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+def _coordinate(location, index):
+    return float(location[index]) if location is not None else float("nan")
+
+def _row(node):
+    location = node["location"]
+    return (
+        node["id"],
+        node["creator"],
+        _coordinate(location["default_location"], 0),
+        _coordinate(location["default_location"], 1),
+        _coordinate(location["live_location"], 0),
+        _coordinate(location["live_location"], 1),
+        float(node["zoom"])
+    )
+
+def _within(bbox, longitudes, latitudes):
+    mask = numpy.zeros(len(longitudes), dtype=bool)
+    for west, south, east, north in split_antimeridian(bbox):
+        mask |= (longitudes >= west) & (longitudes <= east) & (latitudes >= south) & (latitudes <= north)
+    return mask
+
+class NodeSnapshot:
+    def __init__(self, nodes, sync_token):
+        self.ids = numpy.empty(0, dtype=object)
+        self.creators = numpy.empty(0, dtype=object)
+        self.longitudes = numpy.empty(0)
+        self.latitudes = numpy.empty(0)
+        self.live_longitudes = numpy.empty(0)
+        self.live_latitudes = numpy.empty(0)
+        self.zooms = numpy.empty(0)
+        self.present = numpy.empty(0, dtype=bool)
+        self.rows = {}
+        self._append([_row(node) for node in nodes])
+        self.sync_token = sync_token
+        self.refreshed_at = time.time()
+
+    def _append(self, rows):
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        start = len(self.ids)
+        for name, values in zip(('ids', 'creators'), columns[:2]):
+            column = numpy.empty(len(values), dtype=object)
+            column[:] = values
+            setattr(self, name, numpy.concatenate((getattr(self, name), column)))
+        for name, values in zip(('longitudes', 'latitudes', 'live_longitudes', 'live_latitudes', 'zooms'), columns[2:]):
+            setattr(self, name, numpy.concatenate((getattr(self, name), numpy.array(values, dtype=float))))
+        self.present = numpy.concatenate((self.present, numpy.ones(len(rows), dtype=bool)))
+        for offset, node_id in enumerate(columns[0]):
+            self.rows[node_id] = start + offset
+
+    def update(self, node_ids, nodes):
+        """
+        Replaces the rows of 'node_ids' with 'nodes', the nodes by id that
+        still exist, appending rows for new ones.
+
+        """
+        new_rows = []
+        for node_id in node_ids:
+            index = self.rows.get(node_id)
+            node = nodes.get(node_id)
+            if index is None:
+                if node is not None:
+                    new_rows.append(_row(node))
+                continue
+            if node is None:
+                self.present[index] = False
+                continue
+            (_, self.creators[index], self.longitudes[index], self.latitudes[index],
+             self.live_longitudes[index], self.live_latitudes[index], self.zooms[index]) = _row(node)
+            self.present[index] = True
+        self._append(new_rows)
+
+    def triggers(self, bbox, weights_to_host):
+        """
+        (trigger id, zoom, location) for every node whose location, as the
+        host may see it, lies in 'bbox' or anywhere if it is None.
+        'weights_to_host' maps node ids to their weights towards the host, and
+        is only asked for nodes with a live location.
+
+        """
+        live = ~numpy.isnan(self.live_longitudes)
+        candidates = self.present
+        if bbox is not None:
+            candidates = candidates & (_within(bbox, self.longitudes, self.latitudes) |
+                                       _within(bbox, self.live_longitudes, self.live_latitudes))
+
+        asked = numpy.flatnonzero(candidates & live)
+        asked_ids = self.ids[asked].tolist()
+        weights = weights_to_host(asked_ids)
+        authorized = numpy.zeros(len(self.ids), dtype=bool)
+        authorized[asked] = numpy.isin(numpy.array([weights[node_id] for node_id in asked_ids], dtype=object),
+                                       [PEER, ADMIN])
+
+        longitudes = numpy.where(authorized, self.live_longitudes, self.longitudes)
+        latitudes = numpy.where(authorized, self.live_latitudes, self.latitudes)
+        shown = candidates if bbox is None else candidates & _within(bbox, longitudes, latitudes)
+        rows = numpy.flatnonzero(shown)
+        locations = numpy.column_stack((longitudes[rows], latitudes[rows])).tolist()
+        return list(zip(self.ids[rows].tolist(), self.zooms[rows].tolist(), locations))
+
+def _load():
+    sync_token = current_token()
+    return NodeSnapshot(iter_items(NODE_TABLE.scan, {}), sync_token)
+
+def _refresh(snapshot):
+    sync_token = current_token()
+    changes = changes_since(snapshot.sync_token)
+    if changes is None:
+        return _load()
+    node_ids = list(dict.fromkeys(change["node_id"] for change in changes if change["kind"] == NODE))
+    snapshot.update(node_ids, batch_get_nodes(node_ids))
+    snapshot.sync_token = sync_token
+    snapshot.refreshed_at = time.time()
+    return snapshot
+
+def get_snapshot():
+    """
+    The container's snapshot, loaded or refreshed as needed, or None if
+    snapshots are not enabled.
+
+    """
+    global _snapshot
+    if not SNAPSHOT_ENABLED:
+        return None
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = _load()
+        elif time.time() - _snapshot.refreshed_at > SNAPSHOT_REFRESH:
+            _snapshot = _refresh(_snapshot)
+        return _snapshot
@@ -0,0 +1,123 @@
+"""
+Pagination
+
+DynamoDB returns at most 1 MB per query or scan, so every read that can
+outgrow that goes through here. A read is given as one or more sources,
+each the keyword arguments of one query or scan, and its items are yielded
+lazily, page by page, across the sources in order.
+
+Paged endpoints stop after a client chosen page size and hand out a page
+token, an opaque form of the current source and its LastEvaluatedKey, that
+the next request continues from.
+
+"""
+
+import base64
+import binascii
+import json
+from boto3.dynamodb.conditions import Key, Attr
+
+TAIL_INDEX = "tail-index"
+MAX_PAGE_SIZE = 1000
+
+def edges_by_head(head_id):
+    return {'KeyConditionExpression': Key('head').eq(head_id)}
+
+def edges_by_tail(tail_id):
+    return {'IndexName': TAIL_INDEX, 'KeyConditionExpression': Key('tail').eq(tail_id)}
+
+def network_drops_by_tail(tail_id):
+    source = edges_by_tail(tail_id)
+    source['FilterExpression'] = Attr('drop').attribute_type('M')
+    return source
+
+def iter_items(operation, source):
+    """
+    Every item 'operation' (a table's query or scan) returns for 'source',
+    following LastEvaluatedKey across pages.
+
+    """
+    kwargs = dict(source)
+    while True:
+        response = operation(**kwargs)
+        for item in response["Items"]:
+            yield item
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+def chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def parse_page_size(raw_page_size):
+    try:
+        page_size = int(raw_page_size)
+    except (TypeError, ValueError):
+        return None
+    return page_size if 0 < page_size <= MAX_PAGE_SIZE else None
+
+def make_page_token(source_index, start_key):
+    position = {'source': source_index, 'key': start_key}
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+def parse_page_token(page_token):
+    """
+    The (source index, start key) 'page_token' stands for, or None if it is
+    not a valid token.
+
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(page_token.encode("ascii")).decode("utf-8"))
+    except (AttributeError, ValueError, binascii.Error, UnicodeError):
+        return None
+    if not isinstance(position, dict) or set(position) != {'source', 'key'}:
+        return None
+    source_index, start_key = position['source'], position['key']
+    if not isinstance(source_index, int) or source_index < 0:
+        return None
+    if start_key is not None and not (isinstance(start_key, dict) and all(isinstance(value, str) for value in start_key.values())):
+        return None
+    return source_index, start_key
+
+class Pages:
+    """
+    An iterable over at most 'page_size' items of 'sources', starting where
+    'page_token' left off. Once it has been iterated to the end, 'next_token'
+    is the token of the following page, or None if there is none.
+
+    """
+    def __init__(self, operation, sources, page_size=None, page_token=None):
+        self.operation = operation
+        self.sources = sources
+        self.page_size = page_size
+        self.position = parse_page_token(page_token) if page_token is not None else (0, None)
+        self.next_token = None
+
+    def __iter__(self):
+        source_index, start_key = self.position
+        remaining = self.page_size
+        while source_index < len(self.sources) and remaining != 0:
+            kwargs = dict(self.sources[source_index])
+            if start_key is not None:
+                kwargs["ExclusiveStartKey"] = start_key
+            if remaining is not None:
+                kwargs["Limit"] = remaining
+            response = self.operation(**kwargs)
+            for item in response["Items"]:
+                yield item
+            if remaining is not None:
+                remaining -= len(response["Items"])
+            start_key = response.get("LastEvaluatedKey")
+            if start_key is None:
+                source_index += 1
+
+        self.next_token = None
+        if source_index < len(self.sources):
+            self.next_token = make_page_token(source_index, start_key)
@@ -0,0 +1,55 @@
+"""
+Preconditions
+
+Runs the checks behind a handler's "Enforced Preconditions" cheapest first,
+so that malformed and unauthorized requests are turned away before they
+read, or write, anything more than they must. A rule is a (cost, check)
+pair, where check takes no arguments and raises on failure:
+
+PURE    no I/O, such as the body's composition
+OWNER   the host read that shows the user is its creator
+READ    other single item reads
+QUERY   queries, and checks that may write
+
+Rules run one cost at a time, in the order above, and a failing check stops
+every costlier rule from running. Pure rules run in turn, and rules that do
+I/O at the same cost run concurrently, see concurrency.gather. Since no rule
+but OWNER ones run before the user is known to own the host, an unauthorized
+request costs at most that one read, and an invalid one none.
+
+"""
+
+from concurrency import gather
+
+PURE = 0
+OWNER = 1
+READ = 2
+QUERY = 3
+
+def field(body, name, valid, message, required=True):
+    """
+    A PURE rule that body[name], if 'required' or present, passes 'valid',
+    such as common.valid_string, raising Exception(message) otherwise.
+
+    """
+    def check():
+        if name not in body:
+            if required:
+                raise Exception(message)
+            return
+        if not valid(body[name]):
+            raise Exception(message)
+    return (PURE, check)
+
+def verify(*rules):
+    """
+    Runs 'rules', (cost, check) pairs, as described above.
+
+    """
+    for cost in sorted(set(cost for cost, _ in rules)):
+        checks = [check for rule_cost, check in rules if rule_cost == cost]
+        if cost == PURE:
+            for check in checks:
+                check()
+        else:
+            gather(*checks)
@@ -4,11 +4,23 @@ Read Drop
 Enforced Preconditions:
 1) If 'entity_id' is provided, the entity to host weight cannot be distant.
 2) There exists a node with an id equal to 'host_id' whose creator is 'user_id' 
+3) If provided, 'page_size' is a valid page size
+4) If provided, 'page_token' is a valid page token
+
+Network drops are read at most 'page_size' at a time, local drops come with
+the first page. A non-null "page_token" continues with the next page. Drops
+that fit on one page are read from the adjacency views of the entity and
+the host where they exist.
 
 """
 
-from api_contract import make_APIData, make_APICanvasDrop, make_APIGeoNode, DISTANT
-from common import valid_host_id, get_node, get_weight, get_local_drops, query_network_drops
+from api_contract import make_APIData, make_APICanvasDrop, make_APIGeoNode, DISTANT, PEER, ADMIN
+from storage_cache import valid_host_id, get_weight, get_local_drops
+from batch_access import batch_get_nodes_and_weights, BATCH_GET_LIMIT
+from constants import EDGE_TABLE
+from pagination import Pages, chunks, network_drops_by_tail, parse_page_size, parse_page_token
+from adjacency_view import get_views, weight_to, weight_from, live_nodes
+from preconditions import verify, PURE, OWNER, READ
 
 def _verify_entity_id(host_id, entity_id):
     if get_weight(entity_id, host_id) == DISTANT:
@@ -18,22 +30,80 @@ def _verify_user_is_creator(user_id, host_id):
     if not valid_host_id(user_id, host_id):
         raise Exception("Read Drops: User is not the host's creator")
 
-def _verify(user_id, host_id, entity_id):
-    _verify_entity_id(host_id, entity_id)
-    _verify_user_is_creator(user_id, host_id)
-
-def execute(user_id, host_id, entity_id):
-    _verify(user_id, host_id, entity_id)
-    
-    local_drops = get_local_drops(entity_id)
-    network_drops = query_network_drops(entity_id)
-    
-    canvas_drops = list(map(lambda drop: make_APICanvasDrop(drop), local_drops))
-    for drop in network_drops:
-        node = get_node(drop["id"])
-        from_host_weight = get_weight(host_id, node["id"])
-        to_host_weight = get_weight(node["id"], host_id)
-        api_geo_node = make_APIGeoNode(node, from_host_weight, to_host_weight)
+def _verify_page(page_size, page_token):
+    if page_size is not None and parse_page_size(page_size) is None:
+        raise Exception("Read Drops: 'page_size' is invalid")
+
+    if page_token is not None and parse_page_token(page_token) is None:
+        raise Exception("Read Drops: 'page_token' is invalid")
+
+def _verify(user_id, host_id, entity_id, page_size, page_token):
+    verify(
+        (PURE, lambda: _verify_page(page_size, page_token)),
+        (OWNER, lambda: _verify_user_is_creator(user_id, host_id)),
+        (READ, lambda: _verify_entity_id(host_id, entity_id))
+    )
+
+def _network_canvas_drops(host_id, pages):
+    for network_drops in chunks((edge["drop"] for edge in pages), BATCH_GET_LIMIT):
+        node_ids = [drop["id"] for drop in network_drops]
+        pairs = [(host_id, node_id) for node_id in node_ids] + [(node_id, host_id) for node_id in node_ids]
+        nodes, weights = batch_get_nodes_and_weights(node_ids, pairs)
+
+        for drop in network_drops:
+            if drop["id"] not in nodes:
+                continue
+            node = nodes[drop["id"]]
+            from_host_weight = weights[(host_id, node["id"])]
+            to_host_weight = weights[(node["id"], host_id)]
+            api_geo_node = make_APIGeoNode(node, from_host_weight, to_host_weight)
+            yield make_APICanvasDrop(drop, api_geo_node)
+
+def _view_canvas_drops(host_id, entity_id, page_size):
+    """
+    The drops read from adjacency views, or None where a view is missing or
+    the drops do not fit on one page.
+
+    """
+    views = get_views([entity_id, host_id])
+    entity_view, host_view = views[entity_id], views[host_id]
+    if entity_view is None or host_view is None:
+        return None
+    if page_size is not None and page_size < len(entity_view["drops"]):
+        return None
+
+    live_heads = live_nodes(entity_view, [
+        drop["id"] for drop in entity_view["drops"].values()
+        if drop["id"] in entity_view["nodes"] and weight_to(host_view, drop["id"]) in (PEER, ADMIN)
+    ])
+    canvas_drops = [make_APICanvasDrop(drop) for drop in entity_view["local_drops"]]
+    for head_id in sorted(entity_view["drops"]):
+        drop = entity_view["drops"][head_id]
+        node = live_heads.get(drop["id"], entity_view["nodes"].get(drop["id"]))
+        if node is None:
+            continue
+        api_geo_node = make_APIGeoNode(node, weight_from(host_view, node["id"]), weight_to(host_view, node["id"]))
         canvas_drops.append(make_APICanvasDrop(drop, api_geo_node))
+    return canvas_drops
+
+def execute(user_id, host_id, entity_id, page_size=None, page_token=None):
+    _verify(user_id, host_id, entity_id, page_size, page_token)
+
+    page_size = parse_page_size(page_size) if page_size is not None else None
+    if page_token is None:
+        canvas_drops = _view_canvas_drops(host_id, entity_id, page_size)
+        if canvas_drops is not None:
+            response = make_APIData(canvas_drops)
+            response["page_token"] = None
+            return response
+
+    pages = Pages(EDGE_TABLE.query, [network_drops_by_tail(entity_id)], page_size, page_token)
+
+    canvas_drops = []
+    if page_token is None:
+        canvas_drops += map(lambda drop: make_APICanvasDrop(drop), get_local_drops(entity_id))
+    canvas_drops += _network_canvas_drops(host_id, pages)
 
-    return make_APIData(canvas_drops)
\ No newline at end of file
+    response = make_APIData(canvas_drops)
+    response["page_token"] = pages.next_token
+    return response
@@ -4,12 +4,49 @@ Read Network
 Enforced Preconditions:
 1) If provided, there exists a node with an id equal to 'entity_id' 
 2) There exists a node with an id equal to 'host_id' whose creator is 'user_id'
+3) If provided, 'bbox' is a valid bounding box (west,south,east,north) 
+4) If provided, 'zoom' is a valid zoom level
+5) If provided, 'sync_token' is a valid sync token
+6) If provided, 'page_size' is a valid page size
+7) If provided, 'page_token' is a valid page token
+
+When a 'sync_token' from an earlier response is provided, only what changed
+since is returned ("delta": true): triggers of nodes added or changed, and
+the ids of nodes to drop from the map in "removed". A filtered network has
+anonymous points and is resent whole once anything in it changes. Expired
+tokens, and tokens handed out for another 'entity_id', 'bbox' or 'zoom',
+are answered with the whole network ("delta": false), since a delta would
+miss unchanged nodes that only the new viewport shows.
+
+The whole network is read at most 'page_size' nodes at a time. A non-null
+"page_token" continues with the next page, and only the first page carries
+a "sync_token". A viewport's pages can repeat a trigger, since a node is
+indexed under both its default and its live location. A filtered network
+that fits on one page is read from the adjacency views of the entity and
+the host where they exist.
+
+The whole network read in one page is placed from the container's node
+snapshot when one is enabled, see node_snapshot. It then carries the sync
+token of the snapshot's last refresh, so the next delta starts from what
+the snapshot had seen.
+
+The whole network read in one page at a 'zoom' below MAX_CLUSTER_ZOOM comes
+back clustered, see clustering. Such reads never answer with a delta, since
+a delta could not be applied to clusters.
 
 """
 
-from api_contract import make_APIGeoJSON, make_APIGeoTrigger, make_APIGeoPoint, make_APILocation, PEER
-from common import valid_host_id, get_node, get_weight, query_edges_by_tail
-from constants import NODE_TABLE
+from api_contract import APIGeoFeatures, make_APILocation, PEER, ADMIN
+from storage_cache import valid_host_id, get_node
+from batch_access import batch_get_nodes, batch_get_weights_to, BATCH_GET_LIMIT
+from constants import NODE_TABLE, EDGE_TABLE
+from geo_index import parse_bbox, parse_zoom, node_sources, contains
+from pagination import Pages, iter_items, chunks, edges_by_tail, parse_page_size, parse_page_token
+from change_log import current_token, scoped_token, parse_token, changes_since, NODE
+from adjacency_view import get_views, weight_to, live_nodes
+from clustering import clusters_zoom, cluster_features
+from node_snapshot import get_snapshot
+from preconditions import verify, PURE, OWNER, READ
 
 def _verify_entity_id(entity_id):
     if entity_id is None:
@@ -21,37 +58,189 @@ def _verify_user_is_creator(user_id, host_id):
     if not valid_host_id(user_id, host_id):
         raise Exception("Read Network: User is not the host's creator")
 
-def _verify(user_id, host_id, entity_id):
-    _verify_entity_id(entity_id)
-    _verify_user_is_creator(user_id, host_id)
+def _verify_viewport(bbox, zoom):
+    if bbox is not None and parse_bbox(bbox) is None:
+        raise Exception("Read Network: 'bbox' is invalid")
+
+    if zoom is not None and parse_zoom(zoom) is None:
+        raise Exception("Read Network: 'zoom' is invalid")
+
+def _verify_sync_token(sync_token):
+    if sync_token is not None and parse_token(sync_token) is None:
+        raise Exception("Read Network: 'sync_token' is invalid")
+
+def _verify_page(page_size, page_token):
+    if page_size is not None and parse_page_size(page_size) is None:
+        raise Exception("Read Network: 'page_size' is invalid")
 
-def execute(user_id, host_id, entity_id):
-    _verify(user_id, host_id, entity_id)
+    if page_token is not None and parse_page_token(page_token) is None:
+        raise Exception("Read Network: 'page_token' is invalid")
 
-    visible_nodes = []
-    invisible_nodes = []
+def _verify(user_id, host_id, entity_id, bbox, zoom, sync_token, page_size, page_token):
+    verify(
+        (PURE, lambda: _verify_viewport(bbox, zoom)),
+        (PURE, lambda: _verify_sync_token(sync_token)),
+        (PURE, lambda: _verify_page(page_size, page_token)),
+        (OWNER, lambda: _verify_user_is_creator(user_id, host_id)),
+        (READ, lambda: _verify_entity_id(entity_id))
+    )
+
+def _unique(nodes):
+    seen_ids = set()
+    for node in nodes:
+        if node["id"] not in seen_ids:
+            seen_ids.add(node["id"])
+            yield node
+
+def _network_pages(entity_id, bbox, zoom, page_size, page_token):
+    if entity_id is not None:
+        return Pages(EDGE_TABLE.query, [edges_by_tail(entity_id)], page_size, page_token)
+    sources = node_sources(bbox, zoom) if bbox is not None else None
+    if sources is None:
+        return Pages(NODE_TABLE.scan, [{}], page_size, page_token)
+    return Pages(NODE_TABLE.query, sources, page_size, page_token)
+
+def _read_nodes(entity_id, pages):
+    """
+    Yields (node, visible) for every node on the pages, a chunk at a time.
+
+    """
     if entity_id is None:
-        visible_nodes = NODE_TABLE.scan()["Items"]
-    else: 
-        edges = query_edges_by_tail(entity_id)
+        for node in _unique(pages):
+            yield node, True
+        return
+
+    for edges in chunks(pages, BATCH_GET_LIMIT):
+        nodes = batch_get_nodes([edge["head"] for edge in edges])
         for edge in edges:
-            node = get_node(edge["head"])
-            if edge["weight"] == PEER:
-                visible_nodes.append(node)
+            if edge["head"] in nodes:
+                yield nodes[edge["head"]], edge["weight"] == PEER
+
+def _add_features(features, host_id, rows, bbox, host_view=None):
+    for chunk in chunks(rows, BATCH_GET_LIMIT):
+        visible_ids = [node["id"] for node, visible in chunk if visible]
+        if host_view is not None:
+            to_host_weights = {node_id: weight_to(host_view, node_id) for node_id in visible_ids}
+        else:
+            to_host_weights = batch_get_weights_to(visible_ids, host_id)
+        for node, visible in chunk:
+            if visible:
+                location = make_APILocation(node, to_host_weights[node["id"]])
             else:
-                invisible_nodes.append(node)
-    
-    geo_triggers = []
-    for node in visible_nodes:
-        to_host_weight = get_weight(node["id"], host_id)
-        location = make_APILocation(node, to_host_weight)
-        trigger = make_APIGeoTrigger(node["id"], node["zoom"], location)
-        geo_triggers.append(trigger)
-
-    geo_points = []
-    for node in invisible_nodes:
-        location = make_APILocation(node)
-        point = make_APIGeoPoint(location)
-        geo_points.append(point)
-
-    return make_APIGeoJSON(geo_triggers + geo_points)
\ No newline at end of file
+                location = make_APILocation(node)
+            if bbox is not None and not contains(bbox, location):
+                continue
+            if visible:
+                features.add_trigger(node["id"], node["zoom"], location)
+            else:
+                features.add_point(location)
+
+def _view_features(host_id, entity_id, page_size, bbox):
+    """
+    The filtered network read from adjacency views, or None where a view is
+    missing or the network does not fit on one page.
+
+    """
+    views = get_views([entity_id, host_id])
+    entity_view, host_view = views[entity_id], views[host_id]
+    if entity_view is None or host_view is None:
+        return None
+    if page_size is not None and page_size < len(entity_view["in_weights"]):
+        return None
+
+    head_ids = [head_id for head_id in sorted(entity_view["nodes"]) if head_id in entity_view["in_weights"]]
+    visible_ids = [head_id for head_id in head_ids if entity_view["in_weights"][head_id] == PEER]
+    live_heads = live_nodes(entity_view, [
+        head_id for head_id in visible_ids if weight_to(host_view, head_id) in (PEER, ADMIN)
+    ])
+    rows = [
+        (live_heads.get(head_id, entity_view["nodes"][head_id]), entity_view["in_weights"][head_id] == PEER)
+        for head_id in head_ids
+    ]
+    features = APIGeoFeatures()
+    _add_features(features, host_id, rows, bbox, host_view)
+    return features
+
+def _snapshot_features(host_id, bbox, scope):
+    """
+    The whole network placed from the node snapshot, and the sync token to
+    answer with, or None if snapshots are not enabled.
+
+    """
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return None
+    sync_token = scoped_token(snapshot.sync_token, scope)
+    features = APIGeoFeatures()
+    features.triggers = snapshot.triggers(bbox, lambda node_ids: batch_get_weights_to(node_ids, host_id))
+    return features, sync_token
+
+def _make_map_delta(host_id, changes, bbox):
+    changed_ids = []
+    for change in changes:
+        if change["kind"] == NODE:
+            changed_ids.append(change["node_id"])
+        elif change["tail"] == host_id:
+            changed_ids.append(change["head"])
+    changed_ids = list(dict.fromkeys(changed_ids))
+
+    nodes = batch_get_nodes(changed_ids)
+    features = APIGeoFeatures()
+    _add_features(features, host_id, ((node, True) for node in nodes.values()), bbox)
+    shown_ids = set(trigger_id for trigger_id, _, _ in features.triggers)
+    features.members["removed"] = [node_id for node_id in changed_ids if node_id not in shown_ids]
+    return features
+
+def _entity_changed(host_id, entity_id, changes):
+    changed_ids = set()
+    for change in changes:
+        if change["kind"] == NODE:
+            changed_ids.add(change["node_id"])
+        elif change["tail"] == entity_id or change["tail"] == host_id:
+            return True
+    if not changed_ids:
+        return False
+    return any(edge["head"] in changed_ids for edge in iter_items(EDGE_TABLE.query, edges_by_tail(entity_id)))
+
+def execute(user_id, host_id, entity_id, bbox=None, zoom=None, sync_token=None, page_size=None, page_token=None):
+    _verify(user_id, host_id, entity_id, bbox, zoom, sync_token, page_size, page_token)
+
+    bbox = parse_bbox(bbox) if bbox is not None else None
+    zoom = parse_zoom(zoom) if zoom is not None else None
+    page_size = parse_page_size(page_size) if page_size is not None else None
+    scope = [entity_id, bbox, zoom]
+    next_sync_token = current_token(scope)
+
+    clustered = entity_id is None and clusters_zoom(zoom) and page_size is None and page_token is None
+    next_page_token = None
+    changes = None
+    if sync_token is not None and page_token is None and not clustered:
+        changes = changes_since(sync_token, scope)
+    if changes is not None and entity_id is None:
+        features = _make_map_delta(host_id, changes, bbox)
+        features.members["delta"] = True
+    elif changes is not None and not _entity_changed(host_id, entity_id, changes):
+        features = APIGeoFeatures()
+        features.members["removed"] = []
+        features.members["delta"] = True
+    else:
+        features = None
+        if entity_id is not None and page_token is None:
+            features = _view_features(host_id, entity_id, page_size, bbox)
+        elif entity_id is None and page_size is None and page_token is None:
+            snapshot_features = _snapshot_features(host_id, bbox, scope)
+            if snapshot_features is not None:
+                features, next_sync_token = snapshot_features
+        if features is None:
+            pages = _network_pages(entity_id, bbox, zoom, page_size, page_token)
+            features = APIGeoFeatures()
+            _add_features(features, host_id, _read_nodes(entity_id, pages), bbox)
+            next_page_token = pages.next_token
+        if clustered:
+            features = cluster_features(features, zoom)
+        features.members["delta"] = False
+
+    features.members["page_token"] = next_page_token
+    if page_token is None:
+        features.members["sync_token"] = next_sync_token
+    return features
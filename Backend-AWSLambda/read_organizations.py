@@ -6,7 +6,7 @@ Enforced Preconditions:
 
 """
 
-from api_contract import make_APIGeoJSON, make_APIGeoNode
+from api_contract import APIGeoFeatures
 
 CORNELL = {
     'id': "CORNELL_UNIVERSITY",
@@ -28,9 +28,8 @@ CORNELL = {
 ORGANIZATIONS = [CORNELL]
 
 def execute():
-    api_geo_nodes = []
+    features = APIGeoFeatures()
     for org in ORGANIZATIONS:
-        geo = make_APIGeoNode(org)
-        api_geo_nodes.append(geo)
+        features.add_node(org)
 
-    return make_APIGeoJSON(api_geo_nodes)
\ No newline at end of file
+    return features
\ No newline at end of file
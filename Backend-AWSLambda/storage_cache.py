@@ -0,0 +1,191 @@
+"""
+Storage Cache
+
+Read-through cache over common's node and edge reads, scoped to a single
+request. Repeated reads of the same item within a request are served from
+memory, the request's own writes are recorded so later reads see them, and
+everything is discarded by clear() when the request ends. Absent items are
+cached as None, so a failed lookup is not repeated either.
+
+Nodes can additionally be kept across requests in a warm container, up to
+NODE_CACHE_SIZE of them for at most NODE_CACHE_TTL seconds. A warm node is
+used as is while it is younger than the route's staleness budget, and past
+that only after a read of its 'version' and 'creator' matches. Every write to
+a node must therefore bump its version with VERSION_UPDATE, and every node
+must be created with new_version(), so that a node deleted and created again
+under the same id does not match a warm copy of the old one.
+
+"""
+
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+import common
+from api_contract import ADMIN, DISTANT
+from constants import NODE_TABLE
+
+NODE_CACHE_SIZE = int(os.environ.get("IRIS_NODE_CACHE_SIZE", "0"))
+NODE_CACHE_TTL = float(os.environ.get("IRIS_NODE_CACHE_TTL", "300"))
+
+VERSION_UPDATE = "#version = if_not_exists(#version, :version_zero) + :version_step"
+VERSION_NAMES = {"#version": "version"}
+VERSION_VALUES = {":version_zero": 0, ":version_step": 1}
+
+MISSING = object()
+
+STAMP_NAMES = ("version", "creator")
+
+_nodes = {}
+_edges = {}
+_staleness_budget = 0
+
+_warm_nodes = OrderedDict()
+_warm_lock = threading.Lock()
+
+def clear():
+    global _staleness_budget
+    _nodes.clear()
+    _edges.clear()
+    _staleness_budget = 0
+
+def set_staleness_budget(seconds):
+    """
+    How old, in seconds, a warm node may be and still be used without checking
+    its version, for the rest of the request.
+
+    """
+    global _staleness_budget
+    _staleness_budget = seconds
+
+def _warm_get(node_id):
+    if NODE_CACHE_SIZE <= 0:
+        return MISSING, None
+    with _warm_lock:
+        entry = _warm_nodes.get(node_id)
+        if entry is None:
+            return MISSING, None
+        node, fetched_at = entry
+        age = time.time() - fetched_at
+        if age > NODE_CACHE_TTL:
+            del _warm_nodes[node_id]
+            return MISSING, None
+        _warm_nodes.move_to_end(node_id)
+        return node, age
+
+def _warm_put(node_id, node):
+    if NODE_CACHE_SIZE <= 0:
+        return
+    with _warm_lock:
+        if node is None:
+            _warm_nodes.pop(node_id, None)
+            return
+        _warm_nodes[node_id] = (node, time.time())
+        _warm_nodes.move_to_end(node_id)
+        while len(_warm_nodes) > NODE_CACHE_SIZE:
+            _warm_nodes.popitem(last=False)
+
+def new_version():
+    """
+    The version a new node starts at, unique to the item in practice.
+
+    """
+    return int(time.time() * 1000) * 1000 + random.randrange(1000)
+
+def _stamp(node):
+    return tuple(node.get(name) for name in STAMP_NAMES)
+
+def _stored_stamp(node_id):
+    """
+    The node's stored version and creator, or MISSING if the node no longer
+    exists.
+
+    """
+    key = common.make_node_pkey(node_id)
+    names = {"#k" + str(index): name for index, name in enumerate(key)}
+    names.update({"#s" + str(index): name for index, name in enumerate(STAMP_NAMES)})
+    item = NODE_TABLE.get_item(
+        Key=key,
+        ProjectionExpression=", ".join(names),
+        ExpressionAttributeNames=names
+    ).get("Item")
+    return MISSING if item is None else _stamp(item)
+
+def _read_node(node_id):
+    node, age = _warm_get(node_id)
+    if node is not MISSING:
+        if age <= _staleness_budget:
+            return node
+        stamp = _stored_stamp(node_id)
+        if stamp is MISSING:
+            _warm_put(node_id, None)
+            return None
+        if stamp == _stamp(node):
+            _warm_put(node_id, node)
+            return node
+
+    node = common.get_node(node_id)
+    _warm_put(node_id, node)
+    return node
+
+def cached_node(node_id):
+    """
+    The cached node, None if it is cached as absent, or MISSING if unknown.
+    Warm nodes within the staleness budget count as cached.
+
+    """
+    node = _nodes.get(node_id, MISSING)
+    if node is MISSING:
+        warm_node, age = _warm_get(node_id)
+        if warm_node is not MISSING and age <= _staleness_budget:
+            _nodes[node_id] = node = warm_node
+    return node
+
+def cached_edge(head_id, tail_id):
+    """
+    The cached edge, None if it is cached as absent, or MISSING if unknown.
+
+    """
+    return _edges.get((head_id, tail_id), MISSING)
+
+def remember_node(node_id, node):
+    _nodes[node_id] = node
+    _warm_put(node_id, node)
+
+def forget_node(node_id):
+    _nodes.pop(node_id, None)
+    _warm_put(node_id, None)
+
+def remember_edge(head_id, tail_id, edge):
+    _edges[(head_id, tail_id)] = edge
+
+def forget_edge(head_id, tail_id):
+    _edges.pop((head_id, tail_id), None)
+
+def get_node(node_id):
+    node = _nodes.get(node_id, MISSING)
+    if node is MISSING:
+        node = _read_node(node_id)
+        _nodes[node_id] = node
+    return node
+
+def get_edge(head_id, tail_id):
+    edge = _edges.get((head_id, tail_id), MISSING)
+    if edge is MISSING:
+        edge = common.get_edge(head_id, tail_id)
+        _edges[(head_id, tail_id)] = edge
+    return edge
+
+def get_weight(head_id, tail_id):
+    if head_id == tail_id:
+        return ADMIN
+    edge = get_edge(head_id, tail_id)
+    return edge["weight"] if edge is not None else DISTANT
+
+def get_local_drops(node_id):
+    return get_node(node_id)["drops"]
+
+def valid_host_id(user_id, host_id):
+    host = get_node(host_id)
+    return host is not None and host["creator"] == user_id
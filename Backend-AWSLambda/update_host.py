@@ -10,31 +10,28 @@ Enforced Preconditions:
 
 """
 
-from common import valid_string, valid_location, valid_host_id, make_node_pkey, get_node
+from common import valid_string, valid_location, make_node_pkey
+from storage_cache import valid_host_id, get_node, remember_node, VERSION_UPDATE, VERSION_NAMES, VERSION_VALUES
 from api_contract import make_APIData, make_APIGeoNode, ADMIN
 from constants import NODE_TABLE
+from geo_index import update_expression
+from change_log import record_nodes
+from preconditions import verify, field, OWNER
+import adjacency_view
 import s3_access
 
-def _verify_body_composition(body):
-    if 'description' in body and not valid_string(body["description"]):
-        raise Exception("Update Host: 'description' is invalid")
-    
-    if 'live_location' in body and not valid_location(body["live_location"]):
-        raise Exception("Update Host: 'live_location' is invalid")
-
-    if 'portrait_id' in body and not valid_string(body["portrait_id"]):
-        raise Exception("Update Host: 'portrait_id' is invalid")
-
-    if 'supplement_id' in body and not valid_string(body["supplement_id"]):
-        raise Exception("Update Host: 'supplement_id' is invalid")
-
 def _verify_user_is_creator(user_id, host_id):
     if not valid_host_id(user_id, host_id):
         raise Exception("Update Host: User is not the host's creator")
 
 def _verify(user_id, host_id, body):
-    _verify_body_composition(body)
-    _verify_user_is_creator(user_id, host_id)
+    verify(
+        field(body, 'description', valid_string, "Update Host: 'description' is invalid", required=False),
+        field(body, 'live_location', valid_location, "Update Host: 'live_location' is invalid", required=False),
+        field(body, 'portrait_id', valid_string, "Update Host: 'portrait_id' is invalid", required=False),
+        field(body, 'supplement_id', valid_string, "Update Host: 'supplement_id' is invalid", required=False),
+        (OWNER, lambda: _verify_user_is_creator(user_id, host_id))
+    )
 
 def execute(user_id, host_id, body):
     _verify(user_id, host_id, body)
@@ -47,19 +44,35 @@ def execute(user_id, host_id, body):
     if 'supplement_id' in body and body["supplement_id"] != host["media"]["supplement_id"]:
         s3_access.delete_object(host["media"]["supplement_id"])
     
-    NODE_TABLE.update_item(
+    live_location = body["live_location"] if 'live_location' in body else None
+    index_set, index_remove, index_values = update_expression({
+        'default_location': host["location"]["default_location"],
+        'live_location': live_location
+    })
+    update = 'SET description=:a, #L.live_location=:b, media.portrait_id=:c, media.supplement_id=:d, ' + ", ".join(index_set + [VERSION_UPDATE])
+    if index_remove:
+        update += ' REMOVE ' + ", ".join(index_remove)
+
+    response = NODE_TABLE.update_item(
         Key=make_node_pkey(host_id),
-        UpdateExpression='SET description=:a, #L.live_location=:b, media.portrait_id=:c, media.supplement_id=:d',
+        UpdateExpression=update,
         ExpressionAttributeValues={
             ':a': body["description"] if 'description' in body else host["description"],
-            ':b': body["live_location"] if 'live_location' in body else None,
+            ':b': live_location,
             ':c': body["portrait_id"] if 'portrait_id' in body else host["media"]["portrait_id"],
             ':d': body["supplement_id"] if 'supplement_id' in body else host["media"]["supplement_id"],
+            **index_values,
+            **VERSION_VALUES
         },
         ExpressionAttributeNames={
-            "#L": "location"
-        }
+            "#L": "location",
+            **VERSION_NAMES
+        },
+        ReturnValues="ALL_NEW"
     )
+    remember_node(host_id, response["Attributes"])
+    record_nodes([host_id])
+    adjacency_view.update_node(response["Attributes"], host)
 
     updated_host = get_node(host_id)
     api_geo_node = make_APIGeoNode(updated_host, ADMIN, ADMIN)
@@ -0,0 +1,108 @@
+"""
+Update Live Location
+
+Enforced Preconditions:
+1) 'live_location' is a valid location, or null to stop sharing it
+2) There exists a node with an id equal to 'host_id' whose creator is 'user_id'
+
+A cheaper path than Update Host for frequent device pings. The location is
+written by one conditional UpdateItem, whose condition also enforces 2), and
+only the live location is returned.
+
+A new location is coalesced, that is dropped in favour of the stored one,
+if the stored one was written less than LIVE_LOCATION_INTERVAL seconds ago
+or lies in the same geohash cell of LIVE_LOCATION_PRECISION characters
+(about 40 by 20 metres at 8). Stopping is never coalesced. The response says
+which location is now stored and whether the new one was coalesced.
+
+An accepted ping costs the UpdateItem and its change log entry. Adjacency
+views do not hold live locations, so there is nothing else to update.
+
+"""
+
+import os
+import time
+from boto3.dynamodb.types import TypeDeserializer
+from api_contract import make_APIData, make_APILiveLocation
+from common import valid_location, make_node_pkey
+from storage_cache import remember_node, VERSION_UPDATE, VERSION_NAMES, VERSION_VALUES
+from geo_index import encode, live_update_expression
+from change_log import record_nodes
+from preconditions import verify, field
+from constants import NODE_TABLE
+
+LIVE_LOCATION_INTERVAL = float(os.environ.get("IRIS_LIVE_LOCATION_INTERVAL", "10"))
+LIVE_LOCATION_PRECISION = int(os.environ.get("IRIS_LIVE_LOCATION_PRECISION", "8"))
+
+_deserializer = TypeDeserializer()
+
+def _valid_live_location(live_location):
+    return live_location is None or valid_location(live_location)
+
+def _verify(body):
+    verify(field(body, 'live_location', _valid_live_location, "Update Live Location: 'live_location' is invalid"))
+
+def _condition(live_location, now):
+    condition = "creator = :creator"
+    values = {}
+    if live_location is not None:
+        condition += (" AND (attribute_not_exists(live_updated_at) OR live_updated_at <= :due)"
+                      " AND (attribute_not_exists(live_geohash) OR NOT begins_with(live_geohash, :cell))")
+        values[":due"] = now - int(LIVE_LOCATION_INTERVAL * 1000)
+        values[":cell"] = encode(float(live_location[0]), float(live_location[1]), LIVE_LOCATION_PRECISION)
+    return condition, values
+
+def _stored_host(error):
+    item = error.response.get("Item")
+    if item is None:
+        return None
+    return {name: _deserializer.deserialize(value) for name, value in item.items()}
+
+def execute(user_id, host_id, body):
+    _verify(body)
+
+    live_location = body["live_location"]
+    now = int(time.time() * 1000)
+    index_set, index_remove, index_values = live_update_expression(live_location)
+    set_clauses = ["#L.live_location=:live_location"] + index_set + [VERSION_UPDATE]
+    values = {
+        ':live_location': live_location,
+        ':creator': user_id,
+        **index_values,
+        **VERSION_VALUES
+    }
+    if live_location is not None:
+        set_clauses.append("live_updated_at=:now")
+        values[":now"] = now
+    else:
+        index_remove.append("live_updated_at")
+    update = "SET " + ", ".join(set_clauses)
+    if index_remove:
+        update += " REMOVE " + ", ".join(index_remove)
+    condition, condition_values = _condition(live_location, now)
+
+    try:
+        response = NODE_TABLE.update_item(
+            Key=make_node_pkey(host_id),
+            UpdateExpression=update,
+            ConditionExpression=condition,
+            ExpressionAttributeValues={
+                **values,
+                **condition_values
+            },
+            ExpressionAttributeNames={
+                "#L": "location",
+                **VERSION_NAMES
+            },
+            ReturnValues="ALL_NEW",
+            ReturnValuesOnConditionCheckFailure="ALL_OLD"
+        )
+    except NODE_TABLE.meta.client.exceptions.ConditionalCheckFailedException as error:
+        host = _stored_host(error)
+        if host is None or host["creator"] != user_id:
+            raise Exception("Update Live Location: User is not the host's creator")
+        return make_APIData(make_APILiveLocation(host["location"]["live_location"], coalesced=True))
+
+    remember_node(host_id, response["Attributes"])
+    record_nodes([host_id])
+    return make_APIData(make_APILiveLocation(live_location))
@@ -10,18 +10,23 @@ Enforced Preconditions:
 """
 
 from api_contract import make_APIData, make_APIGeoNode, DISTANT, AQUAINTED, PEER
-from common import valid_host_id, put_edge, get_node, get_weight, delete_edge
+from storage_cache import valid_host_id, get_node, get_weight
+from batch_access import batch_get_edges, batch_write_edges
+from drop_count import release_network_drops
+from change_log import record_edges
+from concurrency import gather
+from preconditions import verify, field, PURE, OWNER, READ
+import adjacency_view
 from constants import OFFICER_IDS
 
-def _verify_body_composition(body):
-    weight = body["weight"]
-    if weight != DISTANT and weight != AQUAINTED and weight != PEER:
-        raise Exception("Update Network: 'weight' is invalid")
+def _valid_weight(weight):
+    return weight == DISTANT or weight == AQUAINTED or weight == PEER
 
-def _verify_entity_id(host_id, entity_id):
+def _verify_entity_is_not_host(host_id, entity_id):
     if host_id == entity_id:
         raise Exception("Update Network: 'entity_id' equals 'host_id'")
 
+def _verify_entity_id(entity_id):
     if get_node(entity_id) is None:
         raise Exception("Update Network: Node 'entity_id' does not exist") 
 
@@ -30,28 +35,39 @@ def _verify_user_is_creator(user_id, host_id):
         raise Exception("Update Network: User is not the host's creator")
 
 def _verify(user_id, host_id, entity_id, body):
-    _verify_body_composition(body)
-    _verify_entity_id(host_id, entity_id)
-    _verify_user_is_creator(user_id, host_id)
+    verify(
+        field(body, 'weight', _valid_weight, "Update Network: 'weight' is invalid"),
+        (PURE, lambda: _verify_entity_is_not_host(host_id, entity_id)),
+        (OWNER, lambda: _verify_user_is_creator(user_id, host_id)),
+        (READ, lambda: _verify_entity_id(entity_id))
+    )
 
-def _execute_edge_update(head_id, tail_id, weight):
+def _execute_edge_updates(pairs, weight):
     if weight == DISTANT:
-        delete_edge(head_id, tail_id)
+        edges = batch_get_edges(pairs)
+        batch_write_edges(deletes=pairs)
+        release_network_drops(edges.values())
+        adjacency_view.update_edges(deletes=pairs)
     else:
-        put_edge(head_id, tail_id, weight)
+        upserts = [(head_id, tail_id, weight) for head_id, tail_id in pairs]
+        batch_write_edges(upserts=upserts)
+        adjacency_view.update_edges(upserts=upserts)
+    record_edges(pairs, removed=(weight == DISTANT))
 
 def execute(user_id, host_id, entity_id, body):
     _verify(user_id, host_id, entity_id, body)
     
     if entity_id not in OFFICER_IDS:
-        _execute_edge_update(host_id, entity_id, body["weight"]) 
-        
+        pairs = [(host_id, entity_id)]
         if host_id in OFFICER_IDS:
-            _execute_edge_update(entity_id, host_id, body["weight"])
+            pairs.append((entity_id, host_id))
+        _execute_edge_updates(pairs, body["weight"])
 
-    entity = get_node(entity_id)
-    from_host_weight = get_weight(host_id, entity_id)
-    to_host_weight = get_weight(entity_id, host_id)
+    entity, from_host_weight, to_host_weight = gather(
+        lambda: get_node(entity_id),
+        lambda: get_weight(host_id, entity_id),
+        lambda: get_weight(entity_id, host_id)
+    )
 
     api_geo_node = make_APIGeoNode(entity, from_host_weight, to_host_weight)
     return make_APIData(api_geo_node)